@@ -37,125 +37,131 @@ end-user in a Help|About screen or equivalent manner.
 """
 
 import numpy as np
+import threading
 from enum import Enum
-from copy import deepcopy
+from collections import OrderedDict
 
 SUN_RADIUS = 0.26667
 
 class spa_data():
-#----------------------INPUT VALUES------------------------
-    year = None             # 4-digit year,      valid range: -2000 to 6000, error code: 1
-    month = None            # 2-digit month,         valid range: 1 to  12,  error code: 2
-    day = None              # 2-digit day,           valid range: 1 to  31,  error code: 3
-    hour = None             # Observer local hour,   valid range: 0 to  24,  error code: 4
-    minute = None           # Observer local minute, valid range: 0 to  59,  error code: 5
-    second = None           # Observer local second, valid range: 0 to <60,  error code: 6
-	
-    delta_ut1 = None        # Fractional second difference between UTC and UT which is used
-# to adjust UTC for earth's irregular rotation rate and is derived
-# from observation only and is reported in this bulletin:
-# http:##maia.usno.navy.mil/ser7/ser7.dat,
-# where delta_ut1 = DUT1
-# valid range: -1 to 1 second (exclusive), error code 17
+    __slots__ = (
+        #----------------------INPUT VALUES------------------------
+        'year',             # 4-digit year,      valid range: -2000 to 6000, error code: 1
+        'month',            # 2-digit month,         valid range: 1 to  12,  error code: 2
+        'day',              # 2-digit day,           valid range: 1 to  31,  error code: 3
+        'hour',             # Observer local hour,   valid range: 0 to  24,  error code: 4
+        'minute',           # Observer local minute, valid range: 0 to  59,  error code: 5
+        'second',           # Observer local second, valid range: 0 to <60,  error code: 6
+
+        'delta_ut1',        # Fractional second difference between UTC and UT which is used
+        # to adjust UTC for earth's irregular rotation rate and is derived
+        # from observation only and is reported in this bulletin:
+        # http:##maia.usno.navy.mil/ser7/ser7.dat,
+        # where delta_ut1 = DUT1
+        # valid range: -1 to 1 second (exclusive), error code 17
+
+        'delta_t',     ## Difference between earth rotation time and terrestrial time
+                             ## It is derived from observation only and is reported in this
+                             ## bulletin: http:##maia.usno.navy.mil/ser7/ser7.dat,
+                             ## where delta_t = 32.184 + (TAI-UTC) - DUT1
+                             ## valid range: -8000 to 8000 seconds, error code: 7
 
-    delta_t = None     ## Difference between earth rotation time and terrestrial time
-                         ## It is derived from observation only and is reported in this
-                         ## bulletin: http:##maia.usno.navy.mil/ser7/ser7.dat,
-                         ## where delta_t = 32.184 + (TAI-UTC) - DUT1
-                         ## valid range: -8000 to 8000 seconds, error code: 7
+        'timezone',    ## Observer time zone (negative west of Greenwich)
+                             ## valid range: -18   to   18 hours,   error code: 8
 
-    timezone = None    ## Observer time zone (negative west of Greenwich)
-                         ## valid range: -18   to   18 hours,   error code: 8
+        'longitude',   ## Observer longitude (negative west of Greenwich)
+                             ## valid range: -180  to  180 degrees, error code: 9
 
-    longitude = None   ## Observer longitude (negative west of Greenwich)
-                         ## valid range: -180  to  180 degrees, error code: 9
+        'latitude',    ## Observer latitude (negative south of equator)
+                             ## valid range: -90   to   90 degrees, error code: 10
 
-    latitude = None    ## Observer latitude (negative south of equator)
-                         ## valid range: -90   to   90 degrees, error code: 10
+        'elevation',   ## Observer elevation [meters]
+                             ## valid range: -6500000 or higher meters,    error code: 11
 
-    elevation = None   ## Observer elevation [meters]
-                         ## valid range: -6500000 or higher meters,    error code: 11
+        'pressure',    ## Annual average local pressure [millibars]
+                             ## valid range:    0 to 5000 millibars,       error code: 12
 
-    pressure = None    ## Annual average local pressure [millibars]
-                         ## valid range:    0 to 5000 millibars,       error code: 12
+        'temperature',  ## Annual average local temperature [degrees Celsius]
+                             ## valid range: -273 to 6000 degrees Celsius, error code 13
 
-    temperature = None  ## Annual average local temperature [degrees Celsius]
-                         ## valid range: -273 to 6000 degrees Celsius, error code 13
+        'slope',       ## Surface slope (measured from the horizontal plane)
+                             ## valid range: -360 to 360 degrees, error code: 14
 
-    slope = None       ## Surface slope (measured from the horizontal plane)
-                         ## valid range: -360 to 360 degrees, error code: 14
+        'azm_rotation', ## Surface azimuth rotation (measured from south to projection of
+                             ##     surface normal on horizontal plane, negative east)
+                             ## valid range: -360 to 360 degrees, error code: 15
 
-    azm_rotation = None ## Surface azimuth rotation (measured from south to projection of
-                         ##     surface normal on horizontal plane, negative east)
-                         ## valid range: -360 to 360 degrees, error code: 15
+        'atmos_refract', ## Atmospheric refraction at sunrise and sunset (0.5667 deg is typical)
+                             ## valid range: -5   to   5 degrees, error code: 16
 
-    atmos_refract = None ## Atmospheric refraction at sunrise and sunset (0.5667 deg is typical)
-                         ## valid range: -5   to   5 degrees, error code: 16
+        'function',       ## Switch to choose functions for desired output (from enumeration)
 
-    function = None       ## Switch to choose functions for desired output (from enumeration)
+        ##-----------------Intermediate OUTPUT VALUES--------------------
 
-    ##-----------------Intermediate OUTPUT VALUES--------------------
+        'jd',         ##Julian day
+        'jc',         ##Julian century
 
-    jd = None         ##Julian day
-    jc = None         ##Julian century
+        'jde',        ##Julian ephemeris day
+        'jce',        ##Julian ephemeris century
+        'jme',        ##Julian ephemeris millennium
 
-    jde = None        ##Julian ephemeris day
-    jce = None        ##Julian ephemeris century
-    jme = None        ##Julian ephemeris millennium
+        'l',          ##earth heliocentric longitude [degrees]
+        'b',          ##earth heliocentric latitude [degrees]
+        'r',          ##earth radius vector [Astronomical Units, AU]
 
-    l = None          ##earth heliocentric longitude [degrees]
-    b = None          ##earth heliocentric latitude [degrees]
-    r = None          ##earth radius vector [Astronomical Units, AU]
+        'theta',      ##geocentric longitude [degrees]
+        'beta',       ##geocentric latitude [degrees]
 
-    theta = None      ##geocentric longitude [degrees]
-    beta = None       ##geocentric latitude [degrees]
+        'x0',         ##mean elongation (moon-sun) [degrees]
+        'x1',         ##mean anomaly (sun) [degrees]
+        'x2',         ##mean anomaly (moon) [degrees]
+        'x3',         ##argument latitude (moon) [degrees]
+        'x4',         ##ascending longitude (moon) [degrees]
 
-    x0 = None         ##mean elongation (moon-sun) [degrees]
-    x1 = None         ##mean anomaly (sun) [degrees]
-    x2 = None         ##mean anomaly (moon) [degrees]
-    x3 = None         ##argument latitude (moon) [degrees]
-    x4 = None         ##ascending longitude (moon) [degrees]
+        'del_psi',    ##nutation longitude [degrees]
+        'del_epsilon', ##nutation obliquity [degrees]
+        'epsilon0',   ##ecliptic mean obliquity [arc seconds]
+        'epsilon',    ##ecliptic true obliquity  [degrees]
 
-    del_psi = np.array([0.0])    ##nutation longitude [degrees]
-    del_epsilon = np.array([0.0])  ##nutation obliquity [degrees]
-    epsilon0 = None   ##ecliptic mean obliquity [arc seconds]
-    epsilon = None    ##ecliptic true obliquity  [degrees]
+        'del_tau',    ##aberration correction [degrees]
+        'lamda',      ##apparent sun longitude [degrees]
+        'nu0',        ##Greenwich mean sidereal time [degrees]
+        'nu',         ##Greenwich sidereal time [degrees]
 
-    del_tau = None    ##aberration correction [degrees]
-    lamda = None      ##apparent sun longitude [degrees]
-    nu0 = None        ##Greenwich mean sidereal time [degrees]
-    nu = None         ##Greenwich sidereal time [degrees]
+        'alpha',      ##geocentric sun right ascension [degrees]
+        'delta',      ##geocentric sun declination [degrees]
 
-    alpha = None      ##geocentric sun right ascension [degrees]
-    delta = None      ##geocentric sun declination [degrees]
+        'h',          ##observer hour angle [degrees]
+        'xi',         ##sun equatorial horizontal parallax [degrees]
+        'del_alpha',  ##sun right ascension parallax [degrees]
+        'delta_prime', ##topocentric sun declination [degrees]
+        'alpha_prime', ##topocentric sun right ascension [degrees]
+        'h_prime',    ##topocentric local hour angle [degrees]
 
-    h = None          ##observer hour angle [degrees]
-    xi = None         ##sun equatorial horizontal parallax [degrees]
-    del_alpha = np.array([0.0])  ##sun right ascension parallax [degrees]
-    delta_prime = np.array([0.0]) ##topocentric sun declination [degrees]
-    alpha_prime = None ##topocentric sun right ascension [degrees]
-    h_prime = None    ##topocentric local hour angle [degrees]
+        'e0',         ##topocentric elevation angle (uncorrected) [degrees]
+        'del_e',      ##atmospheric refraction correction [degrees]
+        'e',          ##topocentric elevation angle (corrected) [degrees]
 
-    e0 = None         ##topocentric elevation angle (uncorrected) [degrees]
-    del_e = None      ##atmospheric refraction correction [degrees]
-    e = None          ##topocentric elevation angle (corrected) [degrees]
+        'eot',        ##equation of time [minutes]
+        'srha',       ##sunrise hour angle [degrees]
+        'ssha',       ##sunset hour angle [degrees]
+        'sta',        ##sun transit altitude [degrees]
 
-    eot = None        ##equation of time [minutes]
-    srha = None       ##sunrise hour angle [degrees]
-    ssha = None       ##sunset hour angle [degrees]
-    sta = None        ##sun transit altitude [degrees]
+        ##---------------------Final OUTPUT VALUES------------------------
 
-    ##---------------------Final OUTPUT VALUES------------------------
+        'zenith',      ##topocentric zenith angle [degrees]
+        'azimuth_astro', ##topocentric azimuth angle (westward from south) [for astronomers]
+        'azimuth',     ##topocentric azimuth angle (eastward from north) [for navigators and solar radiation]
+        'incidence',   ##surface incidence angle [degrees]
 
-    zenith = None      ##topocentric zenith angle [degrees]
-    azimuth_astro = None##topocentric azimuth angle (westward from south) [for astronomers]
-    azimuth = None     ##topocentric azimuth angle (eastward from north) [for navigators and solar radiation]
-    incidence = None   ##surface incidence angle [degrees]
-
-    suntransit = None   ##local sun transit time (or solar noon) [fractional hour]
-    sunrise = None     ##local sunrise time (+/- 30 seconds) [fractional hour]
-    sunset = None      ##local sunset time (+/- 30 seconds) [fractional hour]
+        'suntransit',   ##local sun transit time (or solar noon) [fractional hour]
+        'sunrise',     ##local sunrise time (+/- 30 seconds) [fractional hour]
+        'sunset',      ##local sunset time (+/- 30 seconds) [fractional hour]
+    )
 
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
 
 
 class SPA_FUNC(Enum):
@@ -446,6 +452,33 @@ r_subcount = []
 for i in range(R_COUNT):
     r_subcount.append(len(R_TERMS[i]))
 
+############################
+### Packed form of the earth periodic terms
+### Each table is flattened once into contiguous float64 columns (amplitude A, phase B,
+### frequency C) plus the series order of every term. The weights matrix has A in the
+### column of the term's order, so cos(B + C*jme) @ weights gives all series sums at once.
+############################
+
+PERIODIC_TERMS_BLOCK = 2048  ## epochs evaluated per matrix product (bounds temporary memory)
+
+def pack_earth_periodic_terms(terms):
+    rows = [(term[TERM.A.value], term[TERM.B.value], term[TERM.C.value], i)
+            for i in range(len(terms)) for term in terms[i]]
+    packed    = np.ascontiguousarray(np.array(rows, dtype=np.float64).reshape(-1, 4).T)
+    amplitude = packed[0]
+    phase     = packed[1]
+    frequency = packed[2]
+    order     = packed[3].astype(np.intp)
+
+    weights = np.zeros((len(rows), len(terms)))
+    weights[np.arange(len(rows)), order] = amplitude
+
+    return amplitude, phase, frequency, order, weights
+
+L_PACKED = pack_earth_periodic_terms(L_TERMS)
+B_PACKED = pack_earth_periodic_terms(B_TERMS)
+R_PACKED = pack_earth_periodic_terms(R_TERMS)
+
 
 ############################
 ### Periodic Terms for the nutation in longitude and obliquity
@@ -585,42 +618,107 @@ PE_TERMS = [
     [-3,0,0,0],
 ]
 
+## Matrix form of the nutation terms: arguments for N epochs are (N,5) @ Y_MATRIX -> (N,63)
+## and the sums are reductions against the PE_MATRIX columns.
+
+Y_MATRIX  = np.ascontiguousarray(np.array(Y_TERMS, dtype=np.float64).T)  ## (5, 63), integer valued
+PE_MATRIX = np.array(PE_TERMS, dtype=np.float64)                         ## (63, 4)
+
+
+############################
+### Precision levels
+### A level keeps the earth periodic terms with amplitude A >= earth_threshold (in the
+### 1e-8 rad / 1e-8 AU units of the tables) and the nutation_terms largest nutation terms.
+### It is selected for the Python engine (spa_calculate, spa_calculate_array and everything
+### built on them) with set_spa_precision('tracker'); engine='c' always uses the full series.
+###
+###   level     L/B/R terms   nutation terms   worst-case sun direction error 1900-2100
+###   full      195           63               (reference)
+###   high      140           13               0.00001 degrees
+###   tracker   17            1                0.006 degrees
+###
+### The errors are the largest angle between the topocentric sun directions of the level and
+### of the full series; they are stored as max_error and checked by
+### python spa_accuracy.py --precision. They do not include the error of the full algorithm
+### itself (+/- 0.0003 degrees).
+############################
+
+def truncate_earth_periodic_terms(terms, threshold):
+    return [[term for term in series if term[TERM.A.value] >= threshold] for series in terms]
+
+class spa_precision():
+    __slots__ = ('name', 'earth_threshold', 'nutation_terms', 'max_error', 'l_packed', 'b_packed',
+                 'r_packed', 'y_matrix', 'pe_matrix')
+
+    def __init__(self, name, earth_threshold=0.0, nutation_terms=Y_COUNT, max_error=0.0):
+        self.name            = name
+        self.earth_threshold = earth_threshold
+        self.nutation_terms  = nutation_terms
+        self.max_error       = max_error        ## [degrees] worst-case sun direction error 1900-2100
+
+        self.l_packed = pack_earth_periodic_terms(truncate_earth_periodic_terms(L_TERMS, earth_threshold))
+        self.b_packed = pack_earth_periodic_terms(truncate_earth_periodic_terms(B_TERMS, earth_threshold))
+        self.r_packed = pack_earth_periodic_terms(truncate_earth_periodic_terms(R_TERMS, earth_threshold))
+
+        amplitude = np.abs(PE_MATRIX[:, [TERM_P.PSI_A.value, TERM_P.EPS_C.value]]).max(axis=1)
+        kept      = np.sort(np.argsort(-amplitude, kind='stable')[:nutation_terms])
+        self.y_matrix  = np.ascontiguousarray(Y_MATRIX[:, kept])
+        self.pe_matrix = PE_MATRIX[kept]
+
+    def term_counts(self):
+        return {'earth': sum(packed[0].size for packed in (self.l_packed, self.b_packed, self.r_packed)),
+                'nutation': self.pe_matrix.shape[0]}
+
+SPA_PRECISION_LEVELS = {level.name: level for level in (
+    spa_precision('full'),
+    spa_precision('high',    earth_threshold=25,   nutation_terms=13, max_error=0.00001),
+    spa_precision('tracker', earth_threshold=3000, nutation_terms=1,  max_error=0.006),
+)}
+
+spa_precision_level = SPA_PRECISION_LEVELS['full']
+
+## Selects the precision level by name and returns the name of the previous level; the
+## geocentric cache is cleared since its entries belong to the previous level
+
+def set_spa_precision(name):
+    global spa_precision_level
+    if name not in SPA_PRECISION_LEVELS:
+        raise ValueError("unknown precision level %r, expected one of %s"
+                         % (name, tuple(SPA_PRECISION_LEVELS)))
+
+    previous = spa_precision_level.name
+    spa_precision_level = SPA_PRECISION_LEVELS[name]
+    if geocentric_cache is not None:
+        geocentric_cache.clear()
+    return previous
+
+## All helpers below accept scalars or NumPy arrays; branches are written with np.where
+## so that the same code serves spa_calculate and spa_calculate_array.
+
 def limit_degrees(degrees):
-    degrees /= 360
+    degrees = degrees / 360
     limited = 360 * (degrees - np.floor(degrees))
-    if limited < 0:
-        limited += 360
-    return limited
+    return np.where(limited < 0, limited + 360, limited)
 
 def limit_degrees180pm(degrees):
-    degrees /= 360
+    degrees = degrees / 360
     limited = 360 * (degrees - np.floor(degrees))
-    if limited < -180:
-        limited += 360
-    elif limited > 180:
-        limited -= 360
-    return limited
+    return np.where(limited < -180, limited + 360,
+                    np.where(limited > 180, limited - 360, limited))
 
 def limit_degrees180(degrees):
-    degrees /= 180
+    degrees = degrees / 180
     limited = 180 * (degrees - np.floor(degrees))
-    if limited < 0:
-        limited += 180
-    return limited
+    return np.where(limited < 0, limited + 180, limited)
 
 def limit_zero2one(value):
     limited = value - np.floor(value)
-    if limited < 0:
-        limited += 1
-    return limited
+    return np.where(limited < 0, limited + 1, limited)
 
 def limit_minutes(minutes):
     limited = minutes
-    if limited < -20:
-        limited += 1440
-    elif limited > 20:
-        limited -= 1440
-    return limited
+    return np.where(limited < -20, limited + 1440,
+                    np.where(limited > 20, limited - 1440, limited))
 
 def dayfrac_to_local_hr(dayfrac, timezone):
     return 24.0*limit_zero2one(dayfrac + timezone/24.0)
@@ -630,63 +728,125 @@ def third_order_polynomial(a, b, c, d, x):
 
 ################################
 
+## Inputs may be scalars or arrays; an error code is returned if any element is out of range
+
 def validate_inputs(spa):
-    if spa.year < -2000 or spa.year > 6000:
+    if np.any((spa.year < -2000) | (spa.year > 6000)):
         return 1
-    if spa.month < 1 or spa.month > 12:
+    if np.any((spa.month < 1) | (spa.month > 12)):
         return 2
-    if spa.day < 1 or spa.day > 31:
+    if np.any((spa.day < 1) | (spa.day > 31)):
         return 3
-    if spa.hour < 0 or spa.hour > 24:
+    if np.any((spa.hour < 0) | (spa.hour > 24)):
         return 4
-    if spa.minute < 0 or spa.minute > 59:
+    if np.any((spa.minute < 0) | (spa.minute > 59)):
         return 5
-    if spa.second < 0 or spa.second >= 60:
+    if np.any((spa.second < 0) | (spa.second >= 60)):
         return 6
-    if spa.pressure < 0 or spa.pressure > 5000:
+    if np.any((spa.pressure < 0) | (spa.pressure > 5000)):
         return 12
-    if spa.temperature <= -273 or spa.temperature > 6000:
+    if np.any((spa.temperature <= -273) | (spa.temperature > 6000)):
         return 13
-    if spa.delta_ut1 <= -1 or spa.delta_ut1 >= 1:
+    if np.any((spa.delta_ut1 <= -1) | (spa.delta_ut1 >= 1)):
         return 17
-    if spa.hour == 24 and spa.minute > 0:
+    if np.any((spa.hour == 24) & (spa.minute > 0)):
         return 5
-    if spa.hour == 24 and spa.second > 0:
+    if np.any((spa.hour == 24) & (spa.second > 0)):
         return 6
 
-    if abs(spa.delta_t) > 8000:
+    if np.any(np.abs(spa.delta_t) > 8000):
         return 7
-    if abs(spa.timezone) > 18:
+    if np.any(np.abs(spa.timezone) > 18):
         return 8
-    if abs(spa.longitude) > 180:
+    if np.any(np.abs(spa.longitude) > 180):
         return 9
-    if abs(spa.latitude) > 90:
+    if np.any(np.abs(spa.latitude) > 90):
         return 10
-    if abs(spa.atmos_refract) > 6:
+    if np.any(np.abs(spa.atmos_refract) > 6):
         return 16
-    if spa.elevation < -6500000:
+    if np.any(spa.elevation < -6500000):
         return 11
     if (spa.function == SPA_FUNC.SPA_ZA_INC) or (spa.function == SPA_FUNC.SPA_ALL):
-        if abs(spa.slope) > 360:
+        if np.any(np.abs(spa.slope) > 360):
             return 14
-        if abs(spa.azm_rotation) > 360:
+        if np.any(np.abs(spa.azm_rotation) > 360):
             return 15
 
     return 0
 
+## The checks of validate_inputs as one table for the per-element functions below, in the
+## same order, so that the first failing check of an element gives the code validate_inputs
+## would return for that element alone. Each entry is (error code, input field, mask of the
+## invalid elements); the 24:00 rules belong to the hour but keep the minute/second codes.
+
+SPA_INPUT_CHECKS = (
+    (1,  'year',          lambda spa: (spa.year < -2000) | (spa.year > 6000)),
+    (2,  'month',         lambda spa: (spa.month < 1) | (spa.month > 12)),
+    (3,  'day',           lambda spa: (spa.day < 1) | (spa.day > 31)),
+    (4,  'hour',          lambda spa: (spa.hour < 0) | (spa.hour > 24)),
+    (5,  'minute',        lambda spa: (spa.minute < 0) | (spa.minute > 59)),
+    (6,  'second',        lambda spa: (spa.second < 0) | (spa.second >= 60)),
+    (12, 'pressure',      lambda spa: (spa.pressure < 0) | (spa.pressure > 5000)),
+    (13, 'temperature',   lambda spa: (spa.temperature <= -273) | (spa.temperature > 6000)),
+    (17, 'delta_ut1',     lambda spa: (spa.delta_ut1 <= -1) | (spa.delta_ut1 >= 1)),
+    (5,  'hour',          lambda spa: (spa.hour == 24) & (spa.minute > 0)),
+    (6,  'hour',          lambda spa: (spa.hour == 24) & (spa.second > 0)),
+    (7,  'delta_t',       lambda spa: np.abs(spa.delta_t) > 8000),
+    (8,  'timezone',      lambda spa: np.abs(spa.timezone) > 18),
+    (9,  'longitude',     lambda spa: np.abs(spa.longitude) > 180),
+    (10, 'latitude',      lambda spa: np.abs(spa.latitude) > 90),
+    (16, 'atmos_refract', lambda spa: np.abs(spa.atmos_refract) > 6),
+    (11, 'elevation',     lambda spa: spa.elevation < -6500000),
+)
+
+## Checked only when the incidence angle is calculated (SPA_ZA_INC, SPA_ALL)
+SPA_INCIDENCE_INPUT_CHECKS = (
+    (14, 'slope',         lambda spa: np.abs(spa.slope) > 360),
+    (15, 'azm_rotation',  lambda spa: np.abs(spa.azm_rotation) > 360),
+)
+
+def input_checks(spa):
+    if (spa.function == SPA_FUNC.SPA_ZA_INC) or (spa.function == SPA_FUNC.SPA_ALL):
+        return SPA_INPUT_CHECKS + SPA_INCIDENCE_INPUT_CHECKS
+    return SPA_INPUT_CHECKS
+
+## Per-element version of validate_inputs: an array of error codes of the broadcast input
+## shape, 0 where the element is valid and otherwise the code validate_inputs would return
+## for that element alone
+
+def set_error_code(code, error, number):
+    return np.where((code == 0) & error, number, code)
+
+def validate_inputs_array(spa):
+    code = np.int32(0)
+    for number, name, check in input_checks(spa):
+        code = set_error_code(code, check(spa), number)
+
+    return np.asarray(code)
+
+## Elements of every input field that fail any of its checks, in the shape of that field (not
+## the broadcast shape, except that the 24:00 rules mark the hour in the shape of hour with
+## minute/second)
+
+def invalid_input_masks(spa):
+    masks = {}
+    for number, name, check in input_checks(spa):
+        masks[name] = masks[name] | check(spa) if name in masks else check(spa)
+
+    return masks
+
 def julian_day(year, month, day, hour, minute, second, dut1, tz):
     day_decimal = day + (hour - tz +
                          (minute + (second + dut1) / 60) / 60) /24
-    if month < 3:
-        month += 12
-        year -= 1
+    early = month < 3
+    month = np.where(early, month + 12, month)
+    year  = np.where(early, year - 1, year)
 
-    julian_day = int(365.25*(year+4716)) + int(30.6001*(month+1)) + \
+    julian_day = np.trunc(365.25*(year+4716)) + np.trunc(30.6001*(month+1)) + \
                  day_decimal - 1524.5
 
-    if julian_day > 2299160:
-        a = int(year/100)
-        julian_day += (2 - a + int(a/4))
+    a = np.trunc(year/100)
+    julian_day = np.where(julian_day > 2299160, julian_day + (2 - a + np.trunc(a/4)), julian_day)
 
     return julian_day
 
@@ -702,43 +862,39 @@ def julian_ephemeris_century(jde):
 def julian_ephemeris_millennium(jce):
     return (jce/10.0)
 
-def earth_periodic_term_summation(terms, count, jme):
-    sum = 0
-    for i in range(count):
-        sum += terms[i][TERM.A.value]*np.cos(terms[i][TERM.B.value]+terms[i][TERM.C.value]*jme)
-    return sum
+## Sum of the periodic terms of every series order, then Horner evaluation of the
+## polynomial in jme; jme may be a scalar or an array of any shape.
+
+def earth_values(packed, jme):
+    amplitude, phase, frequency, order, weights = packed
+    jme  = np.asarray(jme, dtype=np.float64)
+    flat = jme.reshape(-1)
+    values = np.empty_like(flat)
+
+    for start in range(0, flat.size, PERIODIC_TERMS_BLOCK):
+        block    = flat[start:start + PERIODIC_TERMS_BLOCK]
+        term_sum = np.cos(phase + np.multiply.outer(block, frequency)) @ weights
 
-def earth_values(term_sum, count, jme):
-    sum=0
-    for i in range(count):
-        sum += term_sum[i]*np.power(jme, i)
-    sum /= 1.0e8
-    return sum
+        sum = term_sum[:, -1]
+        for i in range(weights.shape[1] - 2, -1, -1):
+            sum = sum*block + term_sum[:, i]
+        values[start:start + PERIODIC_TERMS_BLOCK] = sum / 1.0e8
+
+    return values.reshape(jme.shape)
 
 def earth_heliocentric_longitude(jme):
-    sum = np.zeros(L_COUNT)
-    for i in range(L_COUNT):
-        sum[i] = earth_periodic_term_summation(L_TERMS[i], l_subcount[i], jme)
-    return limit_degrees(np.rad2deg(earth_values(sum, L_COUNT, jme)))
+    return limit_degrees(np.rad2deg(earth_values(spa_precision_level.l_packed, jme)))
 
 def earth_heliocentric_latitude(jme):
-    sum = np.zeros(B_COUNT)
-    for i in range(B_COUNT):
-        sum[i] = earth_periodic_term_summation(B_TERMS[i], b_subcount[i], jme)
-    return np.rad2deg(earth_values(sum, B_COUNT, jme))
+    return np.rad2deg(earth_values(spa_precision_level.b_packed, jme))
 
 
 def earth_radius_vector(jme):
-    sum = np.zeros(R_COUNT)
-    for i in range(R_COUNT):
-        sum[i] = earth_periodic_term_summation(R_TERMS[i], r_subcount[i], jme)
-    return earth_values(sum, R_COUNT, jme)
+    return earth_values(spa_precision_level.r_packed, jme)
 
 def geocentric_longitude(l):
     theta = l + 180.0
-    if theta >= 360.0:
-        theta -= 360.0
-    return theta
+    return np.where(theta >= 360.0, theta - 360.0, theta)
 
 def geocentric_latitude(b):
     return -b
@@ -758,22 +914,34 @@ def argument_latitude_moon(jce):
 def ascending_longitude_moon(jce):
     return third_order_polynomial(1.0/450000.0, 0.0020708, -1934.136261, 125.04452, jce)
 
-def xy_term_summation(i, x):
-    sum=0
-    for j in range(len(TERM_X)):
-        sum += x[j]*Y_TERMS[i][j]
-    return sum
+## x holds the five arguments X0..X4 (scalars or arrays broadcastable with jce);
+## returns del_psi and del_epsilon with the broadcast shape.
+
+def nutation_longitude_and_obliquity(jce, x):
+    arrays = np.broadcast_arrays(np.asarray(jce, dtype=np.float64), *x)
+    shape  = arrays[0].shape
+    jce    = arrays[0].reshape(-1)
+    x      = np.stack([a.reshape(-1) for a in arrays[1:]], axis=-1)
+
+    y_matrix, pe_matrix = spa_precision_level.y_matrix, spa_precision_level.pe_matrix
 
-def nutation_longitude_and_obliquity(jce, x, del_psi, del_epsilon):
-    sum_psi=0
-    sum_epsilon=0
-    for i in range(Y_COUNT):
-        xy_term_sum  = np.deg2rad(xy_term_summation(i, x))
-        sum_psi     += (PE_TERMS[i][TERM_P.PSI_A.value] + jce*PE_TERMS[i][TERM_P.PSI_B.value])*np.sin(xy_term_sum)
-        sum_epsilon += (PE_TERMS[i][TERM_P.EPS_C.value] + jce*PE_TERMS[i][TERM_P.EPS_D.value])*np.cos(xy_term_sum)
+    del_psi     = np.empty_like(jce)
+    del_epsilon = np.empty_like(jce)
 
-    del_psi[0]     = sum_psi     / 36000000.0
-    del_epsilon[0] = sum_epsilon / 36000000.0
+    for start in range(0, jce.size, PERIODIC_TERMS_BLOCK):
+        stop        = start + PERIODIC_TERMS_BLOCK
+        block       = jce[start:stop]
+        xy_term_sum = np.deg2rad(x[start:stop] @ y_matrix)
+
+        sin_terms = np.sin(xy_term_sum) @ pe_matrix[:, [TERM_P.PSI_A.value, TERM_P.PSI_B.value]]
+        cos_terms = np.cos(xy_term_sum) @ pe_matrix[:, [TERM_P.EPS_C.value, TERM_P.EPS_D.value]]
+        sum_psi     = sin_terms[:, 0] + block*sin_terms[:, 1]
+        sum_epsilon = cos_terms[:, 0] + block*cos_terms[:, 1]
+
+        del_psi[start:stop]     = sum_psi     / 36000000.0
+        del_epsilon[start:stop] = sum_epsilon / 36000000.0
+
+    return del_psi.reshape(shape), del_epsilon.reshape(shape)
 
 def ecliptic_mean_obliquity(jme):
     u = jme/10.0
@@ -783,7 +951,7 @@ def ecliptic_mean_obliquity(jme):
 
 
 def ecliptic_true_obliquity(delta_epsilon, epsilon0):
-    return delta_epsilon[0] + epsilon0/3600.0
+    return delta_epsilon + epsilon0/3600.0
 
 def aberration_correction(r):
     return -20.4898 / (3600.0*r)
@@ -796,7 +964,7 @@ def greenwich_mean_sidereal_time (jd, jc):
                                        jc*jc*(0.000387933 - jc/38710000.0))
 
 def greenwich_sidereal_time (nu0, delta_psi, epsilon):
-    return nu0 + delta_psi[0]*np.cos(np.deg2rad(epsilon))
+    return nu0 + delta_psi*np.cos(np.deg2rad(epsilon))
 
 def geocentric_right_ascension(lamda, epsilon, beta):
     lamda_rad = np.deg2rad(lamda)
@@ -819,23 +987,38 @@ def sun_equatorial_horizontal_parallax(r):
     return 8.794 / (3600.0 * r)
 
 
-def right_ascension_parallax_and_topocentric_dec(latitude, elevation,
-	       xi, h, delta, delta_alpha, delta_prime):
-    lat_rad   = np.deg2rad(latitude)
-    xi_rad    = np.deg2rad(xi)
-    h_rad     = np.deg2rad(h)
-    delta_rad = np.deg2rad(delta)
+## The topocentric helpers take an optional Observer holding the site constants; without it
+## they are derived from latitude/elevation (pressure, temperature, atmos_refract) as before
+
+def observer_radius_terms(latitude, elevation):
+    lat_rad = np.deg2rad(latitude)
     u = np.arctan(0.99664719 * np.tan(lat_rad))
     y = 0.99664719 * np.sin(u) + elevation*np.sin(lat_rad)/6378140.0
     x =              np.cos(u) + elevation*np.cos(lat_rad)/6378140.0
+    return u, x, y
+
+def observer_sin_cos_latitude(latitude, observer):
+    if observer is not None:
+        return observer.sin_lat, observer.cos_lat
+    lat_rad = np.deg2rad(latitude)
+    return np.sin(lat_rad), np.cos(lat_rad)
+
+def right_ascension_parallax_and_topocentric_dec(latitude, elevation, xi, h, delta, observer=None):
+    xi_rad    = np.deg2rad(xi)
+    h_rad     = np.deg2rad(h)
+    delta_rad = np.deg2rad(delta)
+    if observer is not None:
+        x, y = observer.x, observer.y
+    else:
+        u, x, y = observer_radius_terms(latitude, elevation)
 
     delta_alpha_rad =      np.arctan2(                - x*np.sin(xi_rad) *np.sin(h_rad),
                                   np.cos(delta_rad) - x*np.sin(xi_rad) *np.cos(h_rad))
 
-    delta_prime[0] = np.rad2deg(np.arctan2((np.sin(delta_rad) - y*np.sin(xi_rad))*np.cos(delta_alpha_rad),
+    delta_prime = np.rad2deg(np.arctan2((np.sin(delta_rad) - y*np.sin(xi_rad))*np.cos(delta_alpha_rad),
                                   np.cos(delta_rad) - x*np.sin(xi_rad) *np.cos(h_rad)))
 
-    delta_alpha[0] = np.rad2deg(delta_alpha_rad)
+    return np.rad2deg(delta_alpha_rad), delta_prime
 
 
 def topocentric_right_ascension(alpha_deg, delta_alpha):
@@ -848,25 +1031,31 @@ def topocentric_local_hour_angle(h, delta_alpha):
     return h - delta_alpha
 
 
-def topocentric_elevation_angle(latitude, delta_prime, h_prime):
+def topocentric_elevation_angle(latitude, delta_prime, h_prime, observer=None):
 
-    lat_rad         = np.deg2rad(latitude)
-    delta_prime_rad = np.deg2rad(delta_prime)
+    sin_lat, cos_lat = observer_sin_cos_latitude(latitude, observer)
+    delta_prime_rad  = np.deg2rad(delta_prime)
+
+    return np.rad2deg(np.arcsin(sin_lat*np.sin(delta_prime_rad) +
+                        cos_lat*np.cos(delta_prime_rad) * np.cos(np.deg2rad(h_prime))))
+
+
+def refraction_factor(pressure, temperature):
 
-    return np.rad2deg(np.arcsin(np.sin(lat_rad)*np.sin(delta_prime_rad) +
-                        np.cos(lat_rad)*np.cos(delta_prime_rad) * np.cos(np.deg2rad(h_prime))))
+    return (pressure / 1010.0) * (283.0 / (273.0 + temperature)) * 1.02 / 60.0
 
 
 def atmospheric_refraction_correction(pressure, temperature,
-	                                     atmos_refract, e0):
+	                                     atmos_refract, e0, observer=None):
 
-    del_e = 0
+    if observer is not None:
+        factor, limit = observer.refraction_factor, observer.refraction_limit
+    else:
+        factor, limit = refraction_factor(pressure, temperature), -1*(SUN_RADIUS + atmos_refract)
 
-    if (e0 >= -1*(SUN_RADIUS + atmos_refract)):
-        del_e = (pressure / 1010.0) * (283.0 / (273.0 + temperature)) * \
-                 1.02 / (60.0 * np.tan(np.deg2rad(e0 + 10.3/(e0 + 5.11))))
+    del_e = factor / np.tan(np.deg2rad(e0 + 10.3/(e0 + 5.11)))
 
-    return del_e
+    return np.where(e0 >= limit, del_e, 0)
 
 
 def topocentric_elevation_angle_corrected(e0, delta_e):
@@ -879,13 +1068,13 @@ def topocentric_zenith_angle(e):
     return 90.0 - e
 
 
-def topocentric_azimuth_angle_astro(h_prime, latitude, delta_prime):
+def topocentric_azimuth_angle_astro(h_prime, latitude, delta_prime, observer=None):
 
-    h_prime_rad = np.deg2rad(h_prime)
-    lat_rad     = np.deg2rad(latitude)
+    h_prime_rad      = np.deg2rad(h_prime)
+    sin_lat, cos_lat = observer_sin_cos_latitude(latitude, observer)
 
     return limit_degrees(np.rad2deg(np.arctan2(np.sin(h_prime_rad),
-                         np.cos(h_prime_rad)*np.sin(lat_rad) - np.tan(np.deg2rad(delta_prime))*np.cos(lat_rad))))
+                         np.cos(h_prime_rad)*sin_lat - np.tan(np.deg2rad(delta_prime))*cos_lat)))
 
 
 def topocentric_azimuth_angle(azimuth_astro):
@@ -899,6 +1088,20 @@ def surface_incidence_angle(zenith, azimuth_astro, azm_rotation, slope):
     return np.rad2deg(np.arccos(np.cos(zenith_rad)*np.cos(slope_rad)  +
                         np.sin(slope_rad )*np.sin(zenith_rad) * np.cos(np.deg2rad(azimuth_astro - azm_rotation))))
 
+## Unit vectors in the horizontal frame of the observer (x towards the astronomers' azimuth 0,
+## y towards 90 degrees, z to the zenith), stacked on a trailing axis of length 3; the cosine of
+## the incidence angle is the dot product of the sun vector and the surface normal
+
+def sun_vector(zenith, azimuth_astro):
+    zenith_rad  = np.deg2rad(zenith)
+    azimuth_rad = np.deg2rad(azimuth_astro)
+    return np.stack([np.sin(zenith_rad)*np.cos(azimuth_rad),
+                     np.sin(zenith_rad)*np.sin(azimuth_rad),
+                     np.cos(zenith_rad)], axis=-1)
+
+def surface_normal(slope, azm_rotation):
+    return sun_vector(slope, azm_rotation)
+
 
 def sun_mean_longitude(jme):
 
@@ -908,7 +1111,7 @@ def sun_mean_longitude(jme):
 
 def eot(m, alpha, del_psi, epsilon):
 
-    return limit_minutes(4.0*(m - 0.0057183 - alpha + del_psi[0]*np.cos(np.deg2rad(epsilon))))
+    return limit_minutes(4.0*(m - 0.0057183 - alpha + del_psi*np.cos(np.deg2rad(epsilon))))
 
 
 def approx_sun_transit_time(alpha_zero, longitude, nu):
@@ -918,16 +1121,14 @@ def approx_sun_transit_time(alpha_zero, longitude, nu):
 
 def sun_hour_angle_at_rise_set(latitude, delta_zero, h0_prime):
 
-    h0             = -99999
     latitude_rad   = np.deg2rad(latitude)
     delta_zero_rad = np.deg2rad(delta_zero)
     argument       = (np.sin(np.deg2rad(h0_prime)) - np.sin(latitude_rad)*np.sin(delta_zero_rad)) / \
                                                      (np.cos(latitude_rad)*np.cos(delta_zero_rad))
 
-    if abs(argument) <= 1:
-        h0 = limit_degrees180(np.rad2deg(np.arccos(argument)))
+    h0 = limit_degrees180(np.rad2deg(np.arccos(np.clip(argument, -1, 1))))
 
-    return h0
+    return np.where(np.abs(argument) <= 1, h0, -99999)
 
 
 def approx_sun_rise_and_set(m_rts, h0):
@@ -944,10 +1145,8 @@ def rts_alpha_delta_prime(ad, n):
     a = ad[JD.ZERO.value] - ad[JD.MINUS.value]
     b = ad[JD.PLUS.value] - ad[JD.ZERO.value]
 
-    if (abs(a) >= 2.0):
-        a = limit_zero2one(a)
-    if (abs(b) >= 2.0):
-        b = limit_zero2one(b)
+    a = np.where(np.abs(a) >= 2.0, limit_zero2one(a), a)
+    b = np.where(np.abs(b) >= 2.0, limit_zero2one(b), b)
 
     return ad[JD.ZERO.value] + n * (a + b + (b-a)*n)/2.0
 
@@ -969,6 +1168,148 @@ def sun_rise_and_set(m_rts,   h_rts,   delta_prime, latitude,
            np.cos(np.deg2rad(latitude))*np.sin(np.deg2rad(h_prime[sun.value])))
 
 
+################################################################################################
+## Optional LRU cache of the geocentric sun coordinates
+## Keyed by (jd, delta_t); with a resolution [seconds] the jd is first rounded to that step and
+## the coordinates of the rounded instant are reused (the sidereal time is always exact).
+## Only scalar structures are cached, array calculations bypass the cache.
+##
+##     cache = enable_geocentric_cache(maxsize=4096, resolution=60)
+##     ...
+##     cache.stats()   -> {'hits': ..., 'misses': ..., 'size': ..., 'maxsize': ...}
+################################################################################################
+
+SPA_GEOCENTRIC_OUTPUTS = ('jd', 'jc', 'jde', 'jce', 'jme', 'l', 'b', 'r', 'theta', 'beta',
+                          'x0', 'x1', 'x2', 'x3', 'x4', 'del_psi', 'del_epsilon', 'epsilon0',
+                          'epsilon', 'del_tau', 'lamda', 'nu0', 'nu', 'alpha', 'delta')
+
+## Minimal structure for the geocentric stage alone (used for the rise/transit/set and
+## calendar midnights instead of copying a whole spa_data)
+
+class geocentric_state():
+    __slots__ = ('delta_t',) + SPA_GEOCENTRIC_OUTPUTS
+
+GEOCENTRIC_CACHED_VALUES = ('l', 'b', 'r', 'theta', 'beta', 'x0', 'x1', 'x2', 'x3', 'x4',
+                            'del_psi', 'del_epsilon', 'epsilon0', 'epsilon', 'del_tau', 'lamda',
+                            'alpha', 'delta')
+
+class GeocentricCache():
+
+    def __init__(self, maxsize=4096, resolution=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        if resolution is not None and resolution <= 0:
+            raise ValueError("resolution must be a positive number of seconds")
+
+        self.maxsize    = maxsize
+        self.resolution = resolution
+        self.hits       = 0
+        self.misses     = 0
+        self._entries   = OrderedDict()
+        self._lock      = threading.Lock()
+
+    def key(self, jd, delta_t):
+        if self.resolution is None:
+            return float(jd), float(delta_t)
+        return int(np.round((jd - 2451545.0) * 86400.0 / self.resolution)), float(delta_t)
+
+    def fill(self, spa):
+        key = self.key(spa.jd, spa.delta_t)
+
+        with self._lock:
+            values = self._entries.get(key)
+            if values is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if values is None:
+            source = spa
+            if self.resolution is not None:
+                source = geocentric_state()
+                source.jde = julian_ephemeris_day(2451545.0 + key[0] * self.resolution / 86400.0,
+                                                  spa.delta_t)
+                source.jce = julian_ephemeris_century(source.jde)
+                source.jme = julian_ephemeris_millennium(source.jce)
+
+            calculate_geocentric_sun_coordinates(source)
+            values = tuple(getattr(source, name) for name in GEOCENTRIC_CACHED_VALUES)
+
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = values
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+        for name, value in zip(GEOCENTRIC_CACHED_VALUES, values):
+            setattr(spa, name, value)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries), 'maxsize': self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+geocentric_cache = None
+
+def enable_geocentric_cache(maxsize=4096, resolution=None):
+    global geocentric_cache
+    geocentric_cache = GeocentricCache(maxsize, resolution)
+    return geocentric_cache
+
+def disable_geocentric_cache():
+    global geocentric_cache
+    geocentric_cache = None
+
+
+################################################################################################
+## Optional delta_t / delta_ut1 provider
+## With a provider set (e.g. delta_t_table.DeltaTTable), input fields delta_t and delta_ut1 left
+## as None are looked up for every element from the UTC time of the structure, in one
+## vectorized call. spa_calculate, spa_calculate_array (and spa_calculate_stream),
+## spa_calculate_calendar and spa_calculate_events fill them for the calculation only and reset
+## them to None afterwards, so the structure can be reused for other times. SpaLazyResult fills
+## its own copy of the inputs. spa_calculate_geocentric keeps the looked up values, since
+## spa_calculate_sites reads them from that structure: set them to None again before reusing it
+## for other times.
+##
+##     set_delta_t_provider(DeltaTTable('delta_t.bin'))
+##     spa.delta_t = spa.delta_ut1 = None
+##     spa_calculate_array(spa, times)
+################################################################################################
+
+delta_t_provider = None
+
+def set_delta_t_provider(provider):
+    global delta_t_provider
+    delta_t_provider = provider
+    return provider
+
+## (delta_t, delta_ut1) of the provider for UTC times given as local time fields and timezone
+
+def lookup_delta_t(year, month, day, hour, minute, second, timezone):
+    if delta_t_provider is None:
+        raise ValueError("delta_t/delta_ut1 not given and no delta_t provider set")
+    jd = julian_day(year, month, day, hour, minute, second, 0.0, timezone)
+    return delta_t_provider.lookup(jd - 2400000.5)
+
+## Fills delta_t/delta_ut1 fields that are None; returns the names of the filled fields
+
+def fill_delta_t(spa):
+    names = [name for name in ('delta_t', 'delta_ut1') if getattr(spa, name) is None]
+    if names:
+        values = dict(zip(('delta_t', 'delta_ut1'),
+                          lookup_delta_t(spa.year, spa.month, spa.day, spa.hour,
+                                         spa.minute, spa.second, spa.timezone)))
+        for name in names:
+            setattr(spa, name, values[name])
+    return names
+
+
 ################################################################################################
 ## Calculate required SPA parameters to get the right ascension (alpha) and declination (delta)
 ## Note: JD must be already calculated and in structure
@@ -982,6 +1323,20 @@ def calculate_geocentric_sun_right_ascension_and_declination(spa):
     spa.jce = julian_ephemeris_century(spa.jde)
     spa.jme = julian_ephemeris_millennium(spa.jce)
 
+    cache = geocentric_cache
+    if cache is not None and np.ndim(spa.jd) == 0 and np.ndim(spa.delta_t) == 0:
+        cache.fill(spa)
+    else:
+        calculate_geocentric_sun_coordinates(spa)
+
+    spa.nu0 = greenwich_mean_sidereal_time (spa.jd, spa.jc)
+    spa.nu  = greenwich_sidereal_time (spa.nu0, spa.del_psi, spa.epsilon)
+
+
+## Periodic terms, nutation and apparent coordinates (the costly part); needs jce and jme
+
+def calculate_geocentric_sun_coordinates(spa):
+
     spa.l = earth_heliocentric_longitude(spa.jme)
     spa.b = earth_heliocentric_latitude(spa.jme)
     spa.r = earth_radius_vector(spa.jme)
@@ -989,7 +1344,7 @@ def calculate_geocentric_sun_right_ascension_and_declination(spa):
     spa.theta = geocentric_longitude(spa.l)
     spa.beta  = geocentric_latitude(spa.b)
 
-    x = np.zeros(len(TERM_X))
+    x = [None]*len(TERM_X)
 
     x[TERM_X.X0.value] = spa.x0 = mean_elongation_moon_sun(spa.jce)
     x[TERM_X.X1.value] = spa.x1 = mean_anomaly_sun(spa.jce)
@@ -997,15 +1352,13 @@ def calculate_geocentric_sun_right_ascension_and_declination(spa):
     x[TERM_X.X3.value] = spa.x3 = argument_latitude_moon(spa.jce)
     x[TERM_X.X4.value] = spa.x4 = ascending_longitude_moon(spa.jce)
 
-    nutation_longitude_and_obliquity(spa.jce, x, spa.del_psi, spa.del_epsilon)
+    spa.del_psi, spa.del_epsilon = nutation_longitude_and_obliquity(spa.jce, x)
 
     spa.epsilon0 = ecliptic_mean_obliquity(spa.jme)
     spa.epsilon  = ecliptic_true_obliquity(spa.del_epsilon, spa.epsilon0)
 
     spa.del_tau   = aberration_correction(spa.r)
     spa.lamda     = apparent_sun_longitude(spa.theta, spa.del_psi, spa.del_tau)
-    spa.nu0       = greenwich_mean_sidereal_time (spa.jd, spa.jc)
-    spa.nu        = greenwich_sidereal_time (spa.nu0, spa.del_psi, spa.epsilon)
 
     spa.alpha = geocentric_right_ascension(spa.lamda, spa.epsilon, spa.beta)
     spa.delta = geocentric_declination(spa.beta, spa.epsilon, spa.lamda)
@@ -1016,81 +1369,672 @@ def calculate_geocentric_sun_right_ascension_and_declination(spa):
 ########################################################################
 
 def calculate_eot_and_sun_rise_transit_set(spa):
-    h0_prime = -1*(SUN_RADIUS + spa.atmos_refract)
-    sun_rts  = deepcopy(spa)
     m = sun_mean_longitude(spa.jme)
     spa.eot = eot(m, spa.alpha, spa.del_psi, spa.epsilon)
 
-    sun_rts.hour = sun_rts.minute = sun_rts.second = 0
-    sun_rts.delta_ut1 = sun_rts.timezone = 0.0
-
-    sun_rts.jd = julian_day(sun_rts.year,   sun_rts.month,  sun_rts.day,       sun_rts.hour,
-		                     sun_rts.minute, sun_rts.second, sun_rts.delta_ut1, sun_rts.timezone)
+    sun_rts = geocentric_state()
+    sun_rts.jd = julian_day(spa.year, spa.month, spa.day, 0, 0, 0, 0.0, 0.0)
+    sun_rts.delta_t = spa.delta_t
 
     calculate_geocentric_sun_right_ascension_and_declination(sun_rts)
     nu = sun_rts.nu
 
     sun_rts.delta_t = 0
-    sun_rts.jd -= 1
-    alpha = np.zeros(len(JD))
-    delta = np.zeros(len(JD))
+    sun_rts.jd = sun_rts.jd - 1
+    alpha = [None]*len(JD)
+    delta = [None]*len(JD)
     for i in range(len(JD)):
         calculate_geocentric_sun_right_ascension_and_declination(sun_rts)
         alpha[i] = sun_rts.alpha
         delta[i] = sun_rts.delta
-        sun_rts.jd += 1
+        sun_rts.jd = sun_rts.jd + 1
+
+    calculate_sun_rise_transit_set(spa, nu, alpha, delta)
+
+
+## Interpolated rise/transit/set for the day of midnight sidereal time nu, given alpha and
+## delta at the previous, same and next midnight ([JD.MINUS, JD.ZERO, JD.PLUS])
+
+def calculate_sun_rise_transit_set(spa, nu, alpha, delta):
+    h0_prime = -1*(SUN_RADIUS + spa.atmos_refract)
 
-    m_rts = np.zeros(len(SUN))
+    m_rts = [None]*len(SUN)
     m_rts[SUN.TRANSIT.value] = approx_sun_transit_time(alpha[JD.ZERO.value], spa.longitude, nu)
     h0 = sun_hour_angle_at_rise_set(spa.latitude, delta[JD.ZERO.value], h0_prime)
 
-    if h0 >= 0:
+    ## Elements without a sunrise/sunset (h0 < 0) are evaluated too and masked out below
 
-        approx_sun_rise_and_set(m_rts, h0)
+    approx_sun_rise_and_set(m_rts, h0)
 
-        nu_rts = np.zeros(len(SUN))
-        alpha_prime = np.zeros(len(SUN))
-        delta_prime = np.zeros(len(SUN))
-        h_prime = np.zeros(len(SUN))
-        h_rts = np.zeros(len(SUN))
-        for i in range(len(SUN)):
+    h_prime, h_rts, delta_prime = rts_hour_angles_and_altitudes(spa.latitude, spa.longitude,
+                                                                spa.delta_t, nu, alpha, delta, m_rts)
+    m_rts_corrected = rts_corrected_day_fractions(m_rts, h_rts, h_prime, delta_prime,
+                                                  spa.latitude, h0_prime)
 
-            nu_rts[i]      = nu + 360.985647*m_rts[i]
+    has_rts = h0 >= 0
 
-            n              = m_rts[i] + spa.delta_t/86400.0
-            alpha_prime[i] = rts_alpha_delta_prime(alpha, n)
-            delta_prime[i] = rts_alpha_delta_prime(delta, n)
+    spa.srha = np.where(has_rts, h_prime[SUN.RISE.value], -99999)
+    spa.ssha = np.where(has_rts, h_prime[SUN.SET.value], -99999)
+    spa.sta  = np.where(has_rts, h_rts[SUN.TRANSIT.value], -99999)
 
-            h_prime[i]     = limit_degrees180pm(nu_rts[i] + spa.longitude - alpha_prime[i])
+    spa.suntransit = np.where(has_rts, dayfrac_to_local_hr(m_rts_corrected[SUN.TRANSIT.value], spa.timezone), -99999)
+    spa.sunrise    = np.where(has_rts, dayfrac_to_local_hr(m_rts_corrected[SUN.RISE.value],    spa.timezone), -99999)
+    spa.sunset     = np.where(has_rts, dayfrac_to_local_hr(m_rts_corrected[SUN.SET.value],     spa.timezone), -99999)
 
-            h_rts[i]       = rts_sun_altitude(spa.latitude, delta_prime[i], h_prime[i])
 
+## Hour angles, altitudes and declinations of the sun at the day fractions m_rts
 
-        spa.srha = h_prime[SUN.RISE.value]
-        spa.ssha = h_prime[SUN.SET.value]
-        spa.sta  = h_rts[SUN.TRANSIT.value]
+def rts_hour_angles_and_altitudes(latitude, longitude, delta_t, nu, alpha, delta, m_rts):
+    h_prime     = [None]*len(SUN)
+    h_rts       = [None]*len(SUN)
+    delta_prime = [None]*len(SUN)
+    for i in range(len(SUN)):
 
-        spa.suntransit = dayfrac_to_local_hr(m_rts[SUN.TRANSIT.value] - h_prime[SUN.TRANSIT.value] / 360.0,
-                                              spa.timezone)
+        nu_rts         = nu + 360.985647*m_rts[i]
 
-        spa.sunrise = dayfrac_to_local_hr(sun_rise_and_set(m_rts, h_rts, delta_prime,
-                          spa.latitude, h_prime, h0_prime, SUN.RISE), spa.timezone)
+        n              = m_rts[i] + delta_t/86400.0
+        alpha_prime    = rts_alpha_delta_prime(alpha, n)
+        delta_prime[i] = rts_alpha_delta_prime(delta, n)
 
-        spa.sunset  = dayfrac_to_local_hr(sun_rise_and_set(m_rts, h_rts, delta_prime,
-                          spa.latitude, h_prime, h0_prime, SUN.SET),  spa.timezone)
+        h_prime[i]     = limit_degrees180pm(nu_rts + longitude - alpha_prime)
 
-    else:
-        spa.srha = spa.ssha = spa.sta = spa.suntransit = spa.sunrise = spa.sunset = -99999
+        h_rts[i]       = rts_sun_altitude(latitude, delta_prime[i], h_prime[i])
+
+    return h_prime, h_rts, delta_prime
+
+
+## One correction step of the transit (hour angle zero) and of the rise/set (altitude h0_prime)
+## day fractions; the results are not limited to 0..1
+
+def rts_corrected_day_fractions(m_rts, h_rts, h_prime, delta_prime, latitude, h0_prime):
+    m_corrected = [None]*len(SUN)
+    m_corrected[SUN.TRANSIT.value] = m_rts[SUN.TRANSIT.value] - h_prime[SUN.TRANSIT.value] / 360.0
+    m_corrected[SUN.RISE.value]    = sun_rise_and_set(m_rts, h_rts, delta_prime, latitude,
+                                                      h_prime, h0_prime, SUN.RISE)
+    m_corrected[SUN.SET.value]     = sun_rise_and_set(m_rts, h_rts, delta_prime, latitude,
+                                                      h_prime, h0_prime, SUN.SET)
+    return m_corrected
+
+
+
+###########################################################################################
+## Per-observer constants of the topocentric stage
+## Observer(latitude, elevation, pressure, temperature, atmos_refract) (or Observer.from_spa)
+## precomputes everything that depends on the site alone: the latitude in radians and its
+## sine/cosine, the geocentric latitude u with the x/y radius terms, and the refraction factor
+## and limit. Passing it as observer= to spa_calculate, spa_calculate_array or
+## spa_calculate_sites (Python engine) leaves only the time dependent trigonometry per call for a fixed fleet;
+## it must describe the same sites as the observer fields of the structure, with arrays shaped
+## to broadcast like them (spa_calculate_sites adds the time axes itself).
+###########################################################################################
+
+class Observer():
+    __slots__ = ('latitude', 'elevation', 'pressure', 'temperature', 'atmos_refract',
+                 'lat_rad', 'sin_lat', 'cos_lat', 'u', 'x', 'y',
+                 'refraction_factor', 'refraction_limit')
+
+    def __init__(self, latitude, elevation=0.0, pressure=1010.0, temperature=10.0,
+                 atmos_refract=0.5667):
+        self.latitude      = np.asarray(latitude, dtype=np.float64)
+        self.elevation     = np.asarray(elevation, dtype=np.float64)
+        self.pressure      = np.asarray(pressure, dtype=np.float64)
+        self.temperature   = np.asarray(temperature, dtype=np.float64)
+        self.atmos_refract = np.asarray(atmos_refract, dtype=np.float64)
+
+        self.lat_rad = np.deg2rad(self.latitude)
+        self.sin_lat = np.sin(self.lat_rad)
+        self.cos_lat = np.cos(self.lat_rad)
+        self.u, self.x, self.y = observer_radius_terms(self.latitude, self.elevation)
+
+        self.refraction_factor = refraction_factor(self.pressure, self.temperature)
+        self.refraction_limit  = -1*(SUN_RADIUS + self.atmos_refract)
+
+    @classmethod
+    def from_spa(cls, spa):
+        return cls(spa.latitude, spa.elevation, spa.pressure, spa.temperature, spa.atmos_refract)
+
+    def expand_dims(self, axes):
+        observer = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(observer, name, np.expand_dims(getattr(self, name), axes))
+        return observer
+
+
+###########################################################################################
+## Calculate the observer dependent (topocentric) SPA parameters
+## Note: the geocentric values (jd through alpha, delta, nu, r) must already be in structure
+###########################################################################################
+
+def calculate_topocentric_sun_position(spa, observer=None):
+
+    calculate_sun_zenith_and_azimuth(spa, observer)
+
+    if (spa.function == SPA_FUNC.SPA_ZA_INC) or (spa.function == SPA_FUNC.SPA_ALL):
+        spa.incidence  = surface_incidence_angle(spa.zenith, spa.azimuth_astro,
+                                                  spa.azm_rotation, spa.slope)
+
+    if (spa.function == SPA_FUNC.SPA_ZA_RTS) or (spa.function == SPA_FUNC.SPA_ALL):
+        calculate_eot_and_sun_rise_transit_set(spa)
+
+
+## Topocentric coordinates, elevation, zenith and azimuth (h through azimuth)
+
+def calculate_sun_zenith_and_azimuth(spa, observer=None):
+
+    spa.h  = observer_hour_angle(spa.nu, spa.longitude, spa.alpha)
+    spa.xi = sun_equatorial_horizontal_parallax(spa.r)
+
+    spa.del_alpha, spa.delta_prime = right_ascension_parallax_and_topocentric_dec(spa.latitude,
+                                             spa.elevation, spa.xi, spa.h, spa.delta, observer)
+
+    spa.alpha_prime = topocentric_right_ascension(spa.alpha, spa.del_alpha)
+    spa.h_prime     = topocentric_local_hour_angle(spa.h, spa.del_alpha)
+
+    spa.e0      = topocentric_elevation_angle(spa.latitude, spa.delta_prime, spa.h_prime, observer)
+    spa.del_e   = atmospheric_refraction_correction(spa.pressure, spa.temperature,
+                                                     spa.atmos_refract, spa.e0, observer)
+    spa.e       = topocentric_elevation_angle_corrected(spa.e0, spa.del_e)
 
+    spa.zenith        = topocentric_zenith_angle(spa.e)
+    spa.azimuth_astro = topocentric_azimuth_angle_astro(spa.h_prime, spa.latitude,
+                                                                       spa.delta_prime, observer)
+    spa.azimuth       = topocentric_azimuth_angle(spa.azimuth_astro)
+
+
+###########################################################################################
+## Fused topocentric kernel
+## Computes h through azimuth (and incidence for SPA_ZA_INC/SPA_ALL) like
+## calculate_sun_zenith_and_azimuth, but takes every sine/cosine once and derives the others
+## from them (e.g. those of h_prime from h and del_alpha, the azimuth direction for the
+## incidence from the arctan2 arguments). All full size arrays are written with ufunc out=
+## into `out` (a SpaResultArray of the broadcast shape whose columns are any of
+## TOPOCENTRIC_FUSED_FIELDS) and into the scratch arrays of `work` (a dict, filled on first
+## use), so repeated calls with the same out/work allocate only the small time-only or
+## site-only terms. The geocentric values (nu, alpha, delta, r) and longitude, slope,
+## azm_rotation, function are read from the structure, the rest of the site from observer.
+##
+##     out  = SpaResultArray(shape, ('zenith', 'azimuth'))
+##     work = {}
+##     for tick ...:
+##         calculate_topocentric_fused(sites, observer, out, work)
+###########################################################################################
+
+TOPOCENTRIC_FUSED_FIELDS  = ('h', 'del_alpha', 'delta_prime', 'alpha_prime', 'h_prime', 'e0',
+                             'del_e', 'e', 'zenith', 'azimuth_astro', 'azimuth', 'incidence')
+TOPOCENTRIC_FUSED_SCRATCH = ('tmp', 'sin_h', 'cos_h', 'x_sin_xi', 'num', 'den', 'hyp',
+                             'sin_da', 'cos_da', 'sin_dp', 'cos_dp', 'sin_hp', 'cos_hp')
+
+def limit_degrees_out(degrees, tmp):
+    np.divide(degrees, 360, out=degrees)
+    np.floor(degrees, out=tmp)
+    np.subtract(degrees, tmp, out=degrees)
+    np.multiply(degrees, 360, out=degrees)
+
+def calculate_topocentric_fused(spa, observer=None, out=None, work=None):
+    if observer is None:
+        observer = Observer.from_spa(spa)
+    incidence = (spa.function == SPA_FUNC.SPA_ZA_INC) or (spa.function == SPA_FUNC.SPA_ALL)
+
+    shapes = [np.shape(spa.nu), np.shape(spa.longitude), np.shape(observer.x),
+              np.shape(observer.refraction_factor), np.shape(observer.refraction_limit)]
+    if incidence:
+        shapes += [np.shape(spa.slope), np.shape(spa.azm_rotation)]
+    shape = np.broadcast_shapes(*shapes)
+
+    if out is None:
+        out = SpaResultArray(shape, TOPOCENTRIC_FUSED_FIELDS if incidence else TOPOCENTRIC_FUSED_FIELDS[:-1])
+    if work is None:
+        work = {}
+
+    def buffer(name, dtype=np.float64):
+        if name in out.columns:
+            return out.columns[name]
+        if name not in work or work[name].shape != shape:
+            work[name] = np.empty(shape, dtype=dtype)
+        return work[name]
+
+    h, del_alpha, delta_prime, alpha_prime, h_prime, e0, del_e, e, zenith, azimuth_astro, azimuth = \
+        [buffer(name) for name in TOPOCENTRIC_FUSED_FIELDS[:-1]]
+    tmp, sin_h, cos_h, x_sin_xi, num, den, hyp, sin_da, cos_da, sin_dp, cos_dp, sin_hp, cos_hp = \
+        [buffer(name) for name in TOPOCENTRIC_FUSED_SCRATCH]
+    mask = buffer('mask', bool)
+
+    ## time only terms, in the shape of the geocentric values
+    spa.xi    = sun_equatorial_horizontal_parallax(spa.r)
+    sin_xi    = np.sin(np.deg2rad(spa.xi))
+    delta_rad = np.deg2rad(spa.delta)
+    sin_delta = np.sin(delta_rad)
+    cos_delta = np.cos(delta_rad)
+
+    np.add(spa.nu, spa.longitude, out=h)
+    np.subtract(h, spa.alpha, out=h)
+    limit_degrees_out(h, tmp)
+    np.deg2rad(h, out=tmp)
+    np.sin(tmp, out=sin_h)
+    np.cos(tmp, out=cos_h)
+
+    ## parallax in right ascension and topocentric declination
+    np.multiply(observer.x, sin_xi, out=x_sin_xi)
+    np.multiply(x_sin_xi, sin_h, out=num)
+    np.negative(num, out=num)
+    np.multiply(x_sin_xi, cos_h, out=den)
+    np.subtract(cos_delta, den, out=den)
+    np.arctan2(num, den, out=del_alpha)
+    np.hypot(num, den, out=hyp)
+    np.divide(num, hyp, out=sin_da)
+    np.divide(den, hyp, out=cos_da)
+    np.rad2deg(del_alpha, out=del_alpha)
+
+    np.multiply(observer.y, sin_xi, out=num)
+    np.subtract(sin_delta, num, out=num)
+    np.multiply(num, cos_da, out=num)
+    np.arctan2(num, den, out=delta_prime)
+    np.hypot(num, den, out=hyp)
+    np.divide(num, hyp, out=sin_dp)
+    np.divide(den, hyp, out=cos_dp)
+    np.rad2deg(delta_prime, out=delta_prime)
+
+    np.add(spa.alpha, del_alpha, out=alpha_prime)
+    np.subtract(h, del_alpha, out=h_prime)
+
+    ## sin/cos(h_prime) = sin/cos(h - del_alpha)
+    np.multiply(sin_h, cos_da, out=sin_hp)
+    np.multiply(cos_h, sin_da, out=tmp)
+    np.subtract(sin_hp, tmp, out=sin_hp)
+    np.multiply(cos_h, cos_da, out=cos_hp)
+    np.multiply(sin_h, sin_da, out=tmp)
+    np.add(cos_hp, tmp, out=cos_hp)
+
+    ## elevation, refraction and zenith
+    np.multiply(observer.cos_lat, cos_dp, out=tmp)
+    np.multiply(tmp, cos_hp, out=tmp)
+    np.multiply(observer.sin_lat, sin_dp, out=e0)
+    np.add(e0, tmp, out=e0)
+    np.arcsin(e0, out=e0)
+    np.rad2deg(e0, out=e0)
+
+    np.add(e0, 5.11, out=tmp)
+    np.divide(10.3, tmp, out=tmp)
+    np.add(e0, tmp, out=tmp)
+    np.deg2rad(tmp, out=tmp)
+    np.tan(tmp, out=tmp)
+    np.divide(observer.refraction_factor, tmp, out=del_e)
+    np.greater_equal(e0, observer.refraction_limit, out=mask)
+    np.logical_not(mask, out=mask)
+    np.copyto(del_e, 0.0, where=mask)
+
+    np.add(e0, del_e, out=e)
+    np.subtract(90.0, e, out=zenith)
+
+    ## azimuth: arctan2(sin h', cos h' sin(lat) - tan(delta') cos(lat))
+    np.divide(sin_dp, cos_dp, out=tmp)
+    np.multiply(tmp, observer.cos_lat, out=tmp)
+    np.multiply(cos_hp, observer.sin_lat, out=num)
+    np.subtract(num, tmp, out=num)
+    np.arctan2(sin_hp, num, out=azimuth_astro)
+    np.rad2deg(azimuth_astro, out=azimuth_astro)
+    limit_degrees_out(azimuth_astro, tmp)
+    np.add(azimuth_astro, 180.0, out=azimuth)
+    limit_degrees_out(azimuth, tmp)
+
+    ## incidence: cos(zenith) cos(slope) + sin(zenith) sin(slope) cos(azimuth_astro - azm_rotation)
+    if incidence:
+        incidence_angle = buffer('incidence')
+        slope_rad       = np.deg2rad(spa.slope)
+        azm_rad         = np.deg2rad(spa.azm_rotation)
+
+        np.hypot(sin_hp, num, out=hyp)
+        np.divide(sin_hp, hyp, out=sin_da)
+        np.divide(num, hyp, out=cos_da)
+        np.multiply(cos_da, np.cos(azm_rad), out=tmp)
+        np.multiply(sin_da, np.sin(azm_rad), out=hyp)
+        np.add(tmp, hyp, out=tmp)
+
+        np.deg2rad(zenith, out=num)
+        np.sin(num, out=sin_dp)
+        np.cos(num, out=cos_dp)
+        np.multiply(tmp, sin_dp, out=tmp)
+        np.multiply(tmp, np.sin(slope_rad), out=tmp)
+        np.multiply(cos_dp, np.cos(slope_rad), out=num)
+        np.add(num, tmp, out=num)
+        np.arccos(num, out=incidence_angle)
+        np.rad2deg(incidence_angle, out=incidence_angle)
+
+    return out
 
 
 ###########################################################################################
 ## Calculate all SPA parameters and put into structure
 ## Note: All inputs values (listed in header file) must already be in structure
+## engine="c" runs the bundled spa.c instead (see spa_c.py; needs a C compiler)
 ###########################################################################################
-def spa_calculate(spa):
 
-    result = validate_inputs(spa)
+SPA_ENGINES = ('python', 'c')
+
+def spa_calculate(spa, engine='python', observer=None):
+
+    if engine not in SPA_ENGINES:
+        raise ValueError("unknown SPA engine %r, expected one of %s" % (engine, SPA_ENGINES))
+
+    provided = fill_delta_t(spa)
+    try:
+        if engine == 'c':
+            import spa_c
+            return spa_c.spa_calculate(spa)
+
+        result = validate_inputs(spa)
+
+        if result == 0:
+            spa.jd = julian_day(spa.year,   spa.month,  spa.day,       spa.hour,
+                                spa.minute, spa.second, spa.delta_ut1, spa.timezone)
+
+            calculate_geocentric_sun_right_ascension_and_declination(spa)
+            calculate_topocentric_sun_position(spa, observer)
+            unwrap_scalar_outputs(spa)
+
+        return result
+
+    finally:
+        for name in provided:
+            setattr(spa, name, None)
+
+## The np.where based helpers return 0-d arrays for scalar inputs; scalar inputs give
+## np.float64 outputs again, as before the helpers were vectorized (e.g. for json.dumps)
+
+def unwrap_scalar_outputs(spa):
+    for name in SPA_RESULT_FIELDS:
+        value = getattr(spa, name)
+        if isinstance(value, np.ndarray) and value.ndim == 0:
+            setattr(spa, name, value[()])
+
+
+###########################################################################################
+## Array version of spa_calculate
+## Any input field may be a NumPy array (or list); the fields are broadcast against each
+## other, e.g. times of shape (N,) with observers of shape (M, 1) give (M, N) outputs.
+## All outputs are written back to the structure as arrays of the broadcast shape.
+## Returns the per-element error codes (validate_inputs_array); invalid elements do not stop
+## the calculation, their outputs are NaN.
+###########################################################################################
+
+SPA_TIME_INPUTS     = ('year', 'month', 'day', 'hour', 'minute', 'second', 'delta_ut1', 'delta_t',
+                       'timezone')
+SPA_OBSERVER_INPUTS = ('longitude', 'latitude', 'elevation', 'pressure', 'temperature',
+                       'slope', 'azm_rotation', 'atmos_refract')
+SPA_ARRAY_INPUTS    = SPA_TIME_INPUTS + SPA_OBSERVER_INPUTS
+
+## Valid inputs substituted for invalid elements before the array calculation
+SPA_PLACEHOLDER_INPUTS = {'year': 2000, 'month': 1, 'day': 1, 'hour': 12, 'minute': 0, 'second': 0,
+                          'delta_ut1': 0, 'delta_t': 0, 'timezone': 0, 'longitude': 0, 'latitude': 0,
+                          'elevation': 0, 'pressure': 1010, 'temperature': 10, 'slope': 0,
+                          'azm_rotation': 0, 'atmos_refract': 0.5667}
+
+def datetime64_to_time_fields(times):
+    times   = np.asarray(times, dtype='datetime64[us]')
+    years   = times.astype('datetime64[Y]')
+    months  = times.astype('datetime64[M]')
+    days    = times.astype('datetime64[D]')
+    seconds = (times - days) / np.timedelta64(1, 's')
+
+    year   = years.astype(np.int64) + 1970
+    month  = (months - years).astype(np.int64) + 1
+    day    = (days - months).astype(np.int64) + 1
+    hour   = (seconds // 3600).astype(np.int64)
+    minute = ((seconds - 3600*hour) // 60).astype(np.int64)
+    second = seconds - 3600*hour - 60*minute
+
+    return year, month, day, hour, minute, second
+
+def spa_calculate_array(spa, times=None, engine='python', observer=None):
+    if times is not None:
+        spa.year, spa.month, spa.day, spa.hour, spa.minute, spa.second = datetime64_to_time_fields(times)
+
+    for name in SPA_ARRAY_INPUTS:
+        value = getattr(spa, name)
+        if value is not None:
+            setattr(spa, name, np.asarray(value))
+
+    if engine not in SPA_ENGINES:
+        raise ValueError("unknown SPA engine %r, expected one of %s" % (engine, SPA_ENGINES))
+
+    inputs  = {name: getattr(spa, name) for name in SPA_ARRAY_INPUTS}
+    fill_delta_t(spa)
+    result  = validate_inputs_array(spa)
+    invalid = result != 0
+
+    ## invalid elements are calculated with placeholder inputs and then set to NaN; only the
+    ## out of range values are replaced, so every field keeps its shape (e.g. time fields of
+    ## shape (N,) with one invalid site of shape (M, 1) still give one geocentric stage of N)
+    if np.any(invalid):
+        for name, mask in invalid_input_masks(spa).items():
+            if np.any(mask):
+                setattr(spa, name, np.where(mask, SPA_PLACEHOLDER_INPUTS[name], getattr(spa, name)))
+
+    try:
+        if engine == 'c':
+            import spa_c
+            spa_c.spa_calculate_array(spa)
+        else:
+            spa_calculate(spa, observer=observer)
+    finally:
+        for name, value in inputs.items():
+            setattr(spa, name, value)
+
+    if np.any(invalid):
+        for name in spa_output_fields(spa.function):
+            setattr(spa, name, np.where(invalid, np.nan, getattr(spa, name)))
+
+    return result
+
+
+###########################################################################################
+## Columnar (struct of arrays) storage of many SPA results
+## One NumPy array per field instead of one spa_data per result. Columns are read as
+## attributes (results.zenith); scalar results can be stored row by row with store() and a
+## single row is returned as a spa_data by record().
+###########################################################################################
+
+SPA_RESULT_FIELDS    = spa_data.__slots__[spa_data.__slots__.index('jd'):]
+SPA_INCIDENCE_OUTPUTS = ('incidence',)
+SPA_RTS_OUTPUTS      = ('eot', 'srha', 'ssha', 'sta', 'suntransit', 'sunrise', 'sunset')
+
+## Output fields spa_calculate fills for the given function
+
+def spa_output_fields(function):
+    fields = SPA_RESULT_FIELDS
+    if function not in (SPA_FUNC.SPA_ZA_INC, SPA_FUNC.SPA_ALL):
+        fields = tuple(name for name in fields if name not in SPA_INCIDENCE_OUTPUTS)
+    if function not in (SPA_FUNC.SPA_ZA_RTS, SPA_FUNC.SPA_ALL):
+        fields = tuple(name for name in fields if name not in SPA_RTS_OUTPUTS)
+    return fields
+
+class SpaResultArray():
+    __slots__ = ('shape', 'columns')
+
+    def __init__(self, shape, fields=SPA_RESULT_FIELDS):
+        self.shape   = np.empty(shape, dtype=np.uint8).shape
+        self.columns = {name: np.full(self.shape, np.nan) for name in fields}
+
+    @classmethod
+    def from_spa(cls, spa, fields=SPA_RESULT_FIELDS):
+        values  = {name: getattr(spa, name) for name in fields if getattr(spa, name) is not None}
+        arrays  = np.broadcast_arrays(*values.values())
+        results = cls(arrays[0].shape if arrays else (), ())
+        for name, array in zip(values, arrays):
+            results.columns[name] = np.array(array, dtype=np.float64)
+        return results
+
+    def __getattr__(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def store(self, index, spa):
+        for name, column in self.columns.items():
+            value = getattr(spa, name)
+            if value is not None:
+                column[index] = value
+
+    def record(self, index):
+        spa = spa_data()
+        for name, column in self.columns.items():
+            setattr(spa, name, column[index])
+        return spa
+
+
+###########################################################################################
+## Lazily evaluated results
+## SpaLazyResult(spa) takes the inputs of the structure (scalars or arrays, copied when the
+## object is made) and runs a pipeline stage only when one of its outputs is first read;
+## every stage runs at most once, e.g.
+##
+##     result = SpaLazyResult(spa)
+##     result.delta      -> time and geocentric stages
+##     result.azimuth    -> adds the topocentric stage (zenith, azimuth, ...)
+##     result.sunrise    -> adds the rise/transit/set stage (needs no topocentric stage)
+##
+## spa.function is ignored; every output can be read (incidence needs slope and
+## azm_rotation). Invalid inputs raise ValueError when the object is made.
+###########################################################################################
+
+SPA_LAZY_STAGES = {
+    ## stage:       (stages it needs, outputs)
+    'time':        ((), ('jd', 'jc', 'jde', 'jce', 'jme')),
+    'geocentric':  (('time',), ('l', 'b', 'r', 'theta', 'beta', 'x0', 'x1', 'x2', 'x3', 'x4',
+                                'del_psi', 'del_epsilon', 'epsilon0', 'epsilon', 'del_tau', 'lamda',
+                                'nu0', 'nu', 'alpha', 'delta')),
+    'topocentric': (('geocentric',), ('h', 'xi', 'del_alpha', 'delta_prime', 'alpha_prime',
+                                      'h_prime', 'e0', 'del_e', 'e', 'zenith', 'azimuth_astro',
+                                      'azimuth')),
+    'incidence':   (('topocentric',), SPA_INCIDENCE_OUTPUTS),
+    'rts':         (('geocentric',), SPA_RTS_OUTPUTS),
+}
+
+SPA_LAZY_FIELD_STAGES = {name: stage for stage, (needs, outputs) in SPA_LAZY_STAGES.items()
+                         for name in outputs}
+
+def calculate_lazy_stage(spa, stage):
+    if stage == 'time':
+        spa.jd = julian_day(spa.year,   spa.month,  spa.day,       spa.hour,
+                            spa.minute, spa.second, spa.delta_ut1, spa.timezone)
+        spa.jc  = julian_century(spa.jd)
+        spa.jde = julian_ephemeris_day(spa.jd, spa.delta_t)
+        spa.jce = julian_ephemeris_century(spa.jde)
+        spa.jme = julian_ephemeris_millennium(spa.jce)
+    elif stage == 'geocentric':
+        calculate_geocentric_sun_right_ascension_and_declination(spa)
+    elif stage == 'topocentric':
+        calculate_sun_zenith_and_azimuth(spa)
+    elif stage == 'incidence':
+        spa.incidence = surface_incidence_angle(spa.zenith, spa.azimuth_astro,
+                                                spa.azm_rotation, spa.slope)
+    elif stage == 'rts':
+        calculate_eot_and_sun_rise_transit_set(spa)
+
+class SpaLazyResult():
+    __slots__ = ('spa', 'stages')
+
+    def __init__(self, spa):
+        self.spa    = spa_data()
+        self.stages = set()
+        for name in SPA_ARRAY_INPUTS:
+            value = getattr(spa, name)
+            setattr(self.spa, name, None if value is None else np.array(value))
+        self.spa.function = spa.function
+        fill_delta_t(self.spa)
+
+        result = validate_inputs(self.spa)
+        if result != 0:
+            raise ValueError("SPA error code %d" % result)
+
+    def evaluate(self, stage):
+        if stage not in self.stages:
+            for needed in SPA_LAZY_STAGES[stage][0]:
+                self.evaluate(needed)
+            calculate_lazy_stage(self.spa, stage)
+            self.stages.add(stage)
+
+    def __getattr__(self, name):
+        stage = SPA_LAZY_FIELD_STAGES.get(name)
+        if stage is not None:
+            self.evaluate(stage)
+        elif name not in spa_data.__slots__:
+            raise AttributeError(name)
+        return getattr(self.spa, name)
+
+
+###########################################################################################
+## Streaming calculation over a long time range
+## step is a np.timedelta64 with a unit or a datetime.timedelta (a plain number is rejected).
+## Yields (times, results) for the times start, start + step, ... before end, in chunks of
+## chunk_size times; results is a SpaResultArray of the requested fields. The times are local
+## times of spa.timezone; the time fields of the structure are replaced per chunk, all other
+## inputs (observer, delta_t, function) are taken from it as given. Memory use depends on
+## chunk_size only, e.g.
+##
+##     for times, results in spa_calculate_stream(spa, '1990-01-01', '2020-01-01',
+##                                                np.timedelta64(1, 'm')):
+##         writer.write(times, results.zenith, results.azimuth)
+###########################################################################################
+
+SPA_STREAM_FIELDS = ('zenith', 'azimuth', 'azimuth_astro', 'incidence', 'e', 'e0',
+                     'delta_prime', 'h_prime')
+
+def spa_calculate_stream(spa, start, end, step, chunk_size=86400, fields=SPA_STREAM_FIELDS):
+    start = np.datetime64(start, 'us')
+    end   = np.datetime64(end, 'us')
+    step  = np.timedelta64(step)
+    if np.datetime_data(step.dtype)[0] == 'generic':
+        raise ValueError("step needs a unit, e.g. np.timedelta64(1, 'm') or datetime.timedelta(minutes=1)")
+    step  = step.astype('timedelta64[us]')
+    if step <= np.timedelta64(0, 'us'):
+        raise ValueError("step must be positive")
+
+    count = max(0, -((start - end) // step))
+    if spa.function not in (SPA_FUNC.SPA_ZA_INC, SPA_FUNC.SPA_ALL):
+        fields = tuple(name for name in fields if name != 'incidence')
+
+    for first in range(0, count, chunk_size):
+        times = start + step*np.arange(first, min(first + chunk_size, count))
+
+        result = spa_calculate_array(spa, times)
+        if np.any(result != 0):
+            raise ValueError("SPA error code %d in chunk starting %s" % (result[result != 0].flat[0], times[0]))
+
+        yield times, SpaResultArray.from_spa(spa, fields)
+
+
+###########################################################################################
+## Shared geocentric stage for many sites
+## The geocentric values depend only on time and delta_t, so they are calculated once by
+## spa_calculate_geocentric and then reused by spa_calculate_sites for any number of
+## observers. Give times in UTC (timezone = 0) when the sites span several time zones.
+##
+##     geo = spa_data();   (time fields as scalars or arrays of shape (N,))
+##     spa_calculate_geocentric(geo)
+##     sites = spa_data(); (observer fields as arrays of shape (M,), function)
+##     spa_calculate_sites(geo, sites)   -> outputs of shape (M, N)
+## With out= (and work=) the topocentric outputs go to the preallocated buffers of the fused
+## kernel (calculate_topocentric_fused) instead of the structure.
+###########################################################################################
+
+def validate_time_inputs(spa):
+    for number, name, check in SPA_INPUT_CHECKS:
+        if name in SPA_TIME_INPUTS and np.any(check(spa)):
+            return number
+
+    return 0
+
+def spa_calculate_geocentric(spa):
+    fill_delta_t(spa)
+    for name in SPA_TIME_INPUTS:
+        setattr(spa, name, np.asarray(getattr(spa, name)))
+
+    result = validate_time_inputs(spa)
 
     if result == 0:
         spa.jd = julian_day(spa.year,   spa.month,  spa.day,       spa.hour,
@@ -1098,36 +2042,188 @@ def spa_calculate(spa):
 
         calculate_geocentric_sun_right_ascension_and_declination(spa)
 
-        spa.h  = observer_hour_angle(spa.nu, spa.longitude, spa.alpha)
-        spa.xi = sun_equatorial_horizontal_parallax(spa.r)
-
-        right_ascension_parallax_and_topocentric_dec(spa.latitude, spa.elevation, spa.xi,
-                                spa.h, spa.delta, spa.del_alpha, spa.delta_prime)
+    return result
 
-        spa.alpha_prime = topocentric_right_ascension(spa.alpha, spa.del_alpha)
-        spa.h_prime     = topocentric_local_hour_angle(spa.h, spa.del_alpha)
+def spa_calculate_sites(geo, sites, observer=None, out=None, work=None):
+    time_axes = tuple(range(-np.ndim(geo.jd), 0))
 
-        spa.e0      = topocentric_elevation_angle(spa.latitude, spa.delta_prime, spa.h_prime)
-        spa.del_e   = atmospheric_refraction_correction(spa.pressure, spa.temperature,
-                                                         spa.atmos_refract, spa.e0)
-        spa.e       = topocentric_elevation_angle_corrected(spa.e0, spa.del_e)
+    ## the observer fields get the time axes for the calculation only, so that the same
+    ## sites structure can be used again for the next times
+    inputs = {name: getattr(sites, name) for name in SPA_OBSERVER_INPUTS}
+    for name, value in inputs.items():
+        if value is not None:
+            setattr(sites, name, np.expand_dims(np.asarray(value), time_axes))
 
-        spa.zenith        = topocentric_zenith_angle(spa.e)
-        spa.azimuth_astro = topocentric_azimuth_angle_astro(spa.h_prime, spa.latitude,
-                                                                           spa.delta_prime)
-        spa.azimuth       = topocentric_azimuth_angle(spa.azimuth_astro)
+    for name in SPA_TIME_INPUTS + SPA_GEOCENTRIC_OUTPUTS:
+        setattr(sites, name, getattr(geo, name))
 
-        if (spa.function == SPA_FUNC.SPA_ZA_INC) or (spa.function == SPA_FUNC.SPA_ALL):
-            spa.incidence  = surface_incidence_angle(spa.zenith, spa.azimuth_astro,
-                                                      spa.azm_rotation, spa.slope)
+    if observer is not None:
+        observer = observer.expand_dims(time_axes)
 
-        if (spa.function == SPA_FUNC.SPA_ZA_RTS) or (spa.function == SPA_FUNC.SPA_ALL):
-            calculate_eot_and_sun_rise_transit_set(spa)
+    try:
+        result = validate_inputs(sites)
 
+        if result == 0 and out is None:
+            calculate_topocentric_sun_position(sites, observer)
+        elif result == 0:
+            calculate_topocentric_fused(sites, observer, out, work)
+            if (sites.function == SPA_FUNC.SPA_ZA_RTS) or (sites.function == SPA_FUNC.SPA_ALL):
+                calculate_eot_and_sun_rise_transit_set(sites)
+    finally:
+        for name, value in inputs.items():
+            setattr(sites, name, value)
 
     return result
 
 
+###########################################################################################
+## Incidence angles of many surfaces
+## Takes a calculated structure (spa_data, or a SpaResultArray with zenith and azimuth_astro)
+## and surfaces given by slope and azm_rotation (scalars or arrays, broadcast together) and
+## returns the incidence angles [degrees] with the sun shape followed by the surface shape,
+## e.g. (times, surfaces). The sun vector is calculated once for all surfaces, so no SPA
+## calculation per orientation is needed.
+###########################################################################################
+
+def surface_incidence_matrix(spa, slope, azm_rotation):
+    sun     = sun_vector(spa.zenith, spa.azimuth_astro)
+    normals = surface_normal(*np.broadcast_arrays(slope, azm_rotation))
+    cosine  = np.tensordot(sun, normals, axes=(-1, -1))
+    return np.rad2deg(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+
+###########################################################################################
+## Sunrise, transit and sunset calendar
+## Calculates eot, srha, ssha, sta, suntransit, sunrise and sunset for `days` consecutive
+## dates starting at year/month/day of the structure (the time of day is ignored). The
+## midnight (0 UT) ephemeris of each date is calculated once and reused by the three-day
+## alpha/delta windows of the previous, same and next date; outputs have a trailing axis of
+## length `days` (observer fields may be arrays, e.g. latitude of shape (M, 1)).
+## Unlike calculate_eot_and_sun_rise_transit_set, the midnight sidereal time and the eot
+## (evaluated at 0 UT) reuse that ephemeris with delta_t = 0; the effect on the times is
+## below a millisecond. Returns 0; invalid inputs raise ValueError, as for
+## spa_calculate_events.
+###########################################################################################
+
+def spa_calculate_calendar(spa, days):
+    filled = calendar_inputs(spa)
+
+    try:
+        midnight, alpha, delta = calendar_midnights(spa, days)
+        today = slice(1, days + 1)
+
+        m = sun_mean_longitude(midnight.jme[today])
+        spa.eot = eot(m, midnight.alpha[today], midnight.del_psi[today], midnight.epsilon[today])
+
+        calculate_sun_rise_transit_set(spa, midnight.nu[today], alpha, delta)
+
+    finally:
+        for name in filled:
+            setattr(spa, name, None)
+
+    return 0
+
+## Inputs of the calendar and event calculations: the time of day defaults to 0:00, delta_ut1
+## to 0 (unless both delta_t and delta_ut1 come from the delta_t provider), all fields become
+## arrays; invalid inputs raise ValueError. Returns the names of the fields filled by the
+## delta_t provider, which the caller resets to None when done
+
+def calendar_inputs(spa):
+    for name in ('hour', 'minute', 'second'):
+        if getattr(spa, name) is None:
+            setattr(spa, name, 0)
+    if spa.delta_ut1 is None and (spa.delta_t is not None or delta_t_provider is None):
+        spa.delta_ut1 = 0
+    filled = fill_delta_t(spa)
+
+    for name in SPA_ARRAY_INPUTS:
+        value = getattr(spa, name)
+        if value is not None:
+            setattr(spa, name, np.asarray(value))
+
+    result = validate_inputs(spa)
+    if result != 0:
+        for name in filled:
+            setattr(spa, name, None)
+        raise ValueError("SPA error code %d" % result)
+
+    return filled
+
+## Geocentric state of the days - 1 .. days midnights (0 UT) and the three-day alpha/delta
+## windows [JD.MINUS, JD.ZERO, JD.PLUS] of the `days` dates
+
+def calendar_midnights(spa, days):
+    midnight = geocentric_state()
+    midnight.jd = julian_day(spa.year, spa.month, spa.day, 0, 0, 0, 0.0, 0.0) + \
+                  np.arange(-1, days + 1)
+    midnight.delta_t = 0
+    calculate_geocentric_sun_right_ascension_and_declination(midnight)
+
+    today = slice(1, days + 1)
+    alpha = [midnight.alpha[:days], midnight.alpha[today], midnight.alpha[2:]]
+    delta = [midnight.delta[:days], midnight.delta[today], midnight.delta[2:]]
+    return midnight, alpha, delta
+
+
+###########################################################################################
+## Elevation crossing events (twilights, custom horizons)
+## Local times at which the centre of the sun rises above and sets below the given geocentric
+## elevations [degrees, no refraction] on `days` consecutive dates starting at
+## year/month/day of the structure, e.g.
+##
+##     events = spa_calculate_events(spa, 365, [SPA_TWILIGHTS['civil'], 15.0])
+##     events.rise[:, 0], events.set[:, 0]    -> civil dawn and dusk of every date
+##
+## Uses the same midnight windows and interpolation as spa_calculate_calendar; the outputs
+## (a SpaResultArray with 'rise' and 'set') have a trailing axis of length days followed by
+## the elevation axis (observer arrays need room for both, e.g. latitude of shape (M, 1, 1)).
+## Every iteration repeats the correction step of the rise/set time at the corrected time;
+## iterations=1 is the single step of the SPA sunrise/sunset (elevation
+## -(SUN_RADIUS + atmos_refract)), which is good to about +/- 30 seconds.
+## As for the SPA sunrise/sunset, the dates are UT dates (0 UT to 0 UT), so for a timezone far
+## from UT a local evening event may belong to the following date. Where the sun does not
+## cross the elevation on a date, rise and set are -99999.
+###########################################################################################
+
+SPA_TWILIGHTS = {'civil': -6.0, 'nautical': -12.0, 'astronomical': -18.0}
+
+def spa_calculate_events(spa, days, elevations, iterations=2):
+    filled = calendar_inputs(spa)
+
+    try:
+        h0_prime       = np.asarray(elevations, dtype=np.float64)
+        elevation_axes = tuple(range(-h0_prime.ndim, 0))
+
+        midnight, alpha, delta = calendar_midnights(spa, days)
+        nu    = np.expand_dims(midnight.nu[1:days + 1], elevation_axes)
+        alpha = [np.expand_dims(value, elevation_axes) for value in alpha]
+        delta = [np.expand_dims(value, elevation_axes) for value in delta]
+
+        m_rts = [None]*len(SUN)
+        m_rts[SUN.TRANSIT.value] = approx_sun_transit_time(alpha[JD.ZERO.value], spa.longitude, nu)
+        h0 = sun_hour_angle_at_rise_set(spa.latitude, delta[JD.ZERO.value], h0_prime)
+        approx_sun_rise_and_set(m_rts, h0)
+
+        for iteration in range(iterations):
+            h_prime, h_rts, delta_prime = rts_hour_angles_and_altitudes(spa.latitude, spa.longitude,
+                                                                        spa.delta_t, nu, alpha, delta, m_rts)
+            m_rts = rts_corrected_day_fractions(m_rts, h_rts, h_prime, delta_prime, spa.latitude, h0_prime)
+
+        has_event = h0 >= 0
+        rise_hr = np.where(has_event, dayfrac_to_local_hr(m_rts[SUN.RISE.value], spa.timezone), -99999)
+        set_hr  = np.where(has_event, dayfrac_to_local_hr(m_rts[SUN.SET.value],  spa.timezone), -99999)
+
+        events = SpaResultArray(rise_hr.shape, ())
+        events.columns['rise'] = np.array(rise_hr, dtype=np.float64)
+        events.columns['set']  = np.array(set_hr,  dtype=np.float64)
+
+    finally:
+        for name in filled:
+            setattr(spa, name, None)
+
+    return events
+
+
 if __name__ == '__main__':
     spa = spa_data()  ##define a spa object
 
@@ -1183,10 +2279,10 @@ if __name__ == '__main__':
         print("{0:10}\t{1:>14.6f}{2}".format("地球日心纬度", spa.b, " 度"))
         print("{0:10}\t{1:>14.6f}{2}".format("地日距离", spa.r, " 天文单位"))
         print("{0:10}\t{1:>14.6f}{2}".format("观察者时角", float(spa.h), " 度"))
-        print("{0:10}\t{1:>14.6f}{2}".format("章动经度", spa.del_psi[0], " 度"))
-        print("{0:10}\t{1:>14.6f}{2}".format("章动倾斜角", spa.del_epsilon[0], " 度"))
+        print("{0:10}\t{1:>14.6f}{2}".format("章动经度", spa.del_psi, " 度"))
+        print("{0:10}\t{1:>14.6f}{2}".format("章动倾斜角", spa.del_epsilon, " 度"))
         print("{0:10}\t{1:>14.6f}{2}".format("黄道倾斜度", spa.epsilon, " 度"))
-        print("{0:10}\t{1:>14.6f}{2}".format("赤纬角", spa.delta_prime[0], " 度"))
+        print("{0:10}\t{1:>14.6f}{2}".format("赤纬角", spa.delta_prime, " 度"))
         print("{0:10}\t{1:>14.6f}{2}".format("天顶角", float(spa.zenith), " 度"))
         print("{0:10}\t{1:>14.6f}{2}".format("高度角", float(spa.e), " 度"))
         print("{0:10}\t{1:>14.6f}{2}".format("方位角", float(spa.azimuth), " 度"))
@@ -1215,7 +2311,7 @@ if __name__ == '__main__':
 # 地球日心纬度    	     -0.000101 度
 # 地日距离      	          0.996542 天文单位
 # 观察者时角     	         11.105902 度
-# 章动经度      	         -0.003995 度
+# 章动经度      	         -0.003998 度
 # 章动倾斜角     	          0.001667 度
 # 黄道倾斜度     	         23.440465 度
 # 赤纬角       	         -9.316179 度
@@ -0,0 +1,230 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+from timeit import Timer
+
+import numpy as np
+
+from SPA import *
+
+try:
+    import ephem
+except ImportError:
+    ephem = None
+
+ENGINES = ('python', 'python_array', 'c', 'c_array', 'ephem')
+SCALAR_ENGINES = ('python', 'c', 'ephem')
+
+
+def sample_spa(function=SPA_FUNC.SPA_ALL):
+    spa = spa_data()
+    spa.year = 2003
+    spa.month = 10
+    spa.day = 17
+    spa.hour = 12
+    spa.minute = 30
+    spa.second = 30
+    spa.timezone = -7.0
+    spa.delta_ut1 = 0
+    spa.delta_t = 67
+    spa.longitude = -105.1786
+    spa.latitude = 39.742476
+    spa.elevation = 1830.14
+    spa.pressure = 820
+    spa.temperature = 11
+    spa.slope = 30
+    spa.azm_rotation = -10
+    spa.atmos_refract = 0.5667
+    spa.function = function
+    return spa
+
+
+def per_call(statement, number=200, repeat=5):
+    """Best time of one call [s] over `repeat` runs of `number` calls."""
+    return min(Timer(statement).repeat(repeat=repeat, number=number)) / number
+
+
+class dict_spa_data():
+    """spa_data as it was before __slots__: every field set on the instance lives in its __dict__."""
+
+
+def deepcopy_eot_and_sun_rise_transit_set(spa):
+    """The rise/transit/set stage as it was before geocentric_state: the midnight ephemerides
+    ran on a deep copy of the whole structure."""
+    sun_rts = deepcopy(spa)
+    m = sun_mean_longitude(spa.jme)
+    spa.eot = eot(m, spa.alpha, spa.del_psi, spa.epsilon)
+
+    sun_rts.hour = sun_rts.minute = sun_rts.second = 0
+    sun_rts.delta_ut1 = sun_rts.timezone = 0.0
+
+    sun_rts.jd = julian_day(sun_rts.year,   sun_rts.month,  sun_rts.day,       sun_rts.hour,
+                            sun_rts.minute, sun_rts.second, sun_rts.delta_ut1, sun_rts.timezone)
+
+    calculate_geocentric_sun_right_ascension_and_declination(sun_rts)
+    nu = sun_rts.nu
+
+    sun_rts.delta_t = 0
+    sun_rts.jd = sun_rts.jd - 1
+    alpha = [None]*len(JD)
+    delta = [None]*len(JD)
+    for i in range(len(JD)):
+        calculate_geocentric_sun_right_ascension_and_declination(sun_rts)
+        alpha[i] = sun_rts.alpha
+        delta[i] = sun_rts.delta
+        sun_rts.jd = sun_rts.jd + 1
+
+    calculate_sun_rise_transit_set(spa, nu, alpha, delta)
+
+
+def benchmark_rts(number=200):
+    """Per-call cost of the rise/transit/set stage, with the deep copy it used to make
+    (on a dict based structure holding the same fields) and with geocentric_state."""
+    spa = sample_spa()
+    spa_calculate(spa)
+    old_spa = dict_spa_data()
+    for name in spa_data.__slots__:
+        if getattr(spa, name) is not None:
+            setattr(old_spa, name, getattr(spa, name))
+
+    za = per_call(lambda: spa_calculate(sample_spa(SPA_FUNC.SPA_ZA)), number)
+    za_rts = per_call(lambda: spa_calculate(sample_spa(SPA_FUNC.SPA_ZA_RTS)), number)
+    ## alternate the two stages so that both see the same machine load
+    stage = deepcopy_stage = np.inf
+    for _ in range(5):
+        stage = min(stage, per_call(lambda: calculate_eot_and_sun_rise_transit_set(spa), number, 1))
+        deepcopy_stage = min(deepcopy_stage,
+                             per_call(lambda: deepcopy_eot_and_sun_rise_transit_set(old_spa), number, 1))
+
+    return {'spa_za': za, 'spa_za_rts': za_rts, 'rts_stage': stage,
+            'rts_stage_deepcopy': deepcopy_stage, 'deepcopy_saved': deepcopy_stage - stage}
+
+
+def sample_times(count, seed=0):
+    """Reproducible random UTC times in 2000-2030."""
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, 30 * 365 * 86400, count)
+    return np.datetime64('2000-01-01T00:00:00', 's') + seconds
+
+
+def engine_available(engine):
+    if engine == 'ephem':
+        return ephem is not None
+    if engine in ('c', 'c_array'):
+        try:
+            import spa_c
+            spa_c.load_library()
+        except (OSError, RuntimeError, ImportError):
+            return False
+    return True
+
+
+def runner(engine, times, function=SPA_FUNC.SPA_ZA_INC):
+    """Function running `engine` over all times (one site, UTC)."""
+    spa = sample_spa(function)
+    spa.timezone = 0.0
+
+    if engine in ('python_array', 'c_array'):
+        array_engine = 'python' if engine == 'python_array' else 'c'
+        return lambda: spa_calculate_array(spa, times, engine=array_engine)
+
+    if engine == 'ephem':
+        observer = ephem.Observer()
+        observer.lat, observer.lon = str(spa.latitude), str(spa.longitude)
+        observer.elevation = spa.elevation
+        observer.pressure = spa.pressure
+        observer.temp = spa.temperature
+        sun = ephem.Sun()
+        dates = [ephem.Date(t.item()) for t in times]
+
+        def run():
+            for date in dates:
+                observer.date = date
+                sun.compute(observer)
+        return run
+
+    fields = list(zip(*datetime64_to_time_fields(times)))
+    scalar_engine = engine
+
+    def run():
+        for year, month, day, hour, minute, second in fields:
+            spa.year, spa.month, spa.day = int(year), int(month), int(day)
+            spa.hour, spa.minute, spa.second = int(hour), int(minute), float(second)
+            spa_calculate(spa, engine=scalar_engine)
+    return run
+
+
+def measure(engine, count, scalar_limit):
+    """Throughput and peak memory of `engine` for `count` samples.
+
+    Scalar engines run at most `scalar_limit` samples; their rate is reported per sample.
+    tracemalloc slows down every allocation, so the time is taken from an untraced run and
+    the peak memory from a second, traced run."""
+    measured = min(count, scalar_limit) if engine in SCALAR_ENGINES else count
+    run = runner(engine, sample_times(measured))
+
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'engine': engine, 'samples': count, 'measured_samples': measured,
+            'seconds': elapsed, 'calls_per_second': measured / elapsed, 'peak_memory_bytes': peak}
+
+
+def latency(engine, repeat=5, number=20):
+    """Best single-call time [s] of `engine` for one timestamp."""
+    return per_call(runner(engine, sample_times(1)), number, repeat)
+
+
+def benchmark(engines=ENGINES, sizes=(1000, 10000, 100000), scalar_limit=2000):
+    available = [engine for engine in engines if engine_available(engine)]
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'skipped_engines': [engine for engine in engines if engine not in available],
+        'latency_seconds': {engine: latency(engine) for engine in available},
+        'throughput': [measure(engine, count, scalar_limit) for count in sizes for engine in available],
+        'rts': benchmark_rts(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="SPA 性能测试 (离线)")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--sizes', nargs='+', type=lambda s: int(float(s)), default=[1000, 10000, 100000],
+                        help="样本数, 例如 1e3 1e4 1e5 1e6 1e7")
+    parser.add_argument('--scalar-limit', type=int, default=2000,
+                        help="逐点引擎实际计算的最大样本数")
+    parser.add_argument('--json', help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = benchmark(args.engines, args.sizes, args.scalar_limit)
+
+    for engine in report['skipped_engines']:
+        print("跳过不可用的引擎: %s" % engine)
+    for engine, seconds in report['latency_seconds'].items():
+        print("{0:14}单次调用 {1:>10.1f} us".format(engine, seconds * 1e6))
+    for row in report['throughput']:
+        print("{0:14}{1:>10d} 样本 {2:>14.0f} 次/秒 {3:>10.1f} MB".format(
+            row['engine'], row['samples'], row['calls_per_second'], row['peak_memory_bytes'] / 1e6))
+
+    rts = report['rts']
+    print("日出/正午/日落部分:       %8.1f us" % (rts['rts_stage'] * 1e6))
+    print("原 deepcopy 实现:         %8.1f us" % (rts['rts_stage_deepcopy'] * 1e6))
+    print("每次调用节省:             %8.1f us" % (rts['deepcopy_saved'] * 1e6))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
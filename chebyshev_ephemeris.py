@@ -0,0 +1,178 @@
+"""
+    Chebyshev ephemeris of the geocentric sun for a range of years.
+
+    build_chebyshev_ephemeris() fits, for every day, Chebyshev polynomials in the Julian
+    ephemeris day to the values of the full SPA pipeline (alpha, delta, r, del_psi, epsilon)
+    and writes the coefficients to a binary file together with the maximum fit error found
+    against the full algorithm. ChebyshevEphemeris memory-maps such a file, so any number of
+    worker processes share one copy through the page cache, and evaluates the polynomials
+    instead of the periodic-term and nutation series. The sidereal time nu is rebuilt exactly
+    from jd and the fitted del_psi/epsilon.
+
+        python chebyshev_ephemeris.py ephemeris.bin 1950 2100
+
+    File layout (little endian): a HEADER_SIZE byte header (MAGIC, first jd, number of days,
+    polynomial order, number of quantities, max error of every quantity) followed by the
+    float64 coefficients with shape (days, quantities, order + 1).
+"""
+
+import argparse
+import struct
+
+import numpy as np
+
+from SPA import *
+
+MAGIC = b'SPACHEB1'
+HEADER_FORMAT = '<8sdqqq'
+HEADER_SIZE = 128
+QUANTITIES = ('alpha', 'delta', 'r', 'del_psi', 'epsilon')
+CHECK_POINTS = 4        # points per day (between the fit nodes) used to measure the fit error
+DAYS_PER_BLOCK = 4096   # days fitted per array calculation
+
+
+def chebyshev_nodes(order):
+    n = order + 1
+    return np.cos(np.pi * (np.arange(n) + 0.5) / n)
+
+
+def geocentric_values(jde):
+    geo = geocentric_state()
+    geo.jd = jde
+    geo.delta_t = 0
+    calculate_geocentric_sun_right_ascension_and_declination(geo)
+    return np.stack([getattr(geo, name) for name in QUANTITIES], axis=-2)
+
+
+def unwrap_degrees(values, reference):
+    return values - 360.0 * np.round((values - reference) / 360.0)
+
+
+def fit_days(jd_start, days, order):
+    """Chebyshev coefficients (days, quantities, order + 1) of the days starting at jd_start."""
+    n = order + 1
+    x = chebyshev_nodes(order)
+    jde = jd_start + np.arange(days)[:, np.newaxis] + (x + 1.0) / 2.0
+
+    values = geocentric_values(jde)
+    alpha = QUANTITIES.index('alpha')
+    values[:, alpha] = unwrap_degrees(values[:, alpha], values[:, alpha, :1])
+
+    basis = np.cos(np.pi * np.outer(np.arange(n), np.arange(n) + 0.5) / n) * (2.0 / n)
+    basis[0] /= 2.0
+    return values @ basis.T
+
+
+def evaluate_chebyshev(coefficients, x):
+    """Clenshaw evaluation; coefficients (N, quantities, order + 1), x (N,) in [-1, 1]."""
+    x = x[:, np.newaxis]
+    b1 = np.zeros(coefficients.shape[:2])
+    b2 = np.zeros(coefficients.shape[:2])
+    for k in range(coefficients.shape[2] - 1, 0, -1):
+        b1, b2 = 2.0 * x * b1 - b2 + coefficients[:, :, k], b1
+    return x * b1 - b2 + coefficients[:, :, 0]
+
+
+def build_chebyshev_ephemeris(path, start_year, end_year, order=7):
+    """Fit the years start_year..end_year (inclusive) and write them to path; returns the max errors.
+    The fit is padded by a day on both sides, so jde = jd + delta_t (|delta_t| <= 8000 s) of
+    every time in the years is covered."""
+    jd_start = float(julian_day(start_year, 1, 1, 0, 0, 0, 0.0, 0.0)) - 1
+    days = int(julian_day(end_year + 1, 1, 1, 0, 0, 0, 0.0, 0.0) - jd_start) + 1
+
+    coefficients = np.empty((days, len(QUANTITIES), order + 1))
+    max_error = np.zeros(len(QUANTITIES))
+    alpha = QUANTITIES.index('alpha')
+    offsets = (np.arange(CHECK_POINTS) + 0.5) / CHECK_POINTS
+
+    for first in range(0, days, DAYS_PER_BLOCK):
+        count = min(DAYS_PER_BLOCK, days - first)
+        block = fit_days(jd_start + first, count, order)
+        coefficients[first:first + count] = block
+
+        jde = jd_start + first + np.arange(count)[:, np.newaxis] + offsets
+        exact = geocentric_values(jde.reshape(-1)).T
+        fitted = evaluate_chebyshev(np.repeat(block, CHECK_POINTS, axis=0), 2.0 * np.tile(offsets, count) - 1.0)
+        error = np.abs(fitted - exact)
+        error[:, alpha] = np.abs(unwrap_degrees(fitted[:, alpha] - exact[:, alpha], 0.0))
+        max_error = np.maximum(max_error, error.max(axis=0))
+
+    header = struct.pack(HEADER_FORMAT, MAGIC, jd_start, days, order, len(QUANTITIES))
+    header += max_error.astype('<f8').tobytes()
+    with open(path, 'wb') as file:
+        file.write(header.ljust(HEADER_SIZE, b'\0'))
+        file.write(coefficients.astype('<f8').tobytes())
+
+    return dict(zip(QUANTITIES, max_error))
+
+
+class ChebyshevEphemeris():
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            header = file.read(HEADER_SIZE)
+        magic, self.jd_start, self.days, self.order, count = struct.unpack_from(HEADER_FORMAT, header)
+        if magic != MAGIC or count != len(QUANTITIES):
+            raise ValueError("%s is not a Chebyshev ephemeris file" % path)
+
+        errors = np.frombuffer(header, dtype='<f8', count=count, offset=struct.calcsize(HEADER_FORMAT))
+        self.max_error = dict(zip(QUANTITIES, errors))
+        self.coefficients = np.memmap(path, dtype='<f8', mode='r', offset=HEADER_SIZE,
+                                      shape=(self.days, count, self.order + 1))
+
+    def evaluate(self, jde):
+        """Fitted values of QUANTITIES at the Julian ephemeris days jde (scalar or array)."""
+        jde = np.asarray(jde, dtype=np.float64)
+        flat = jde.reshape(-1)
+        day = np.floor(flat - self.jd_start).astype(np.int64)
+        if np.any((day < 0) | (day >= self.days)):
+            raise ValueError("time outside the ephemeris range (jd %.1f to %.1f)"
+                             % (self.jd_start, self.jd_start + self.days))
+
+        values = evaluate_chebyshev(self.coefficients[day], 2.0 * (flat - self.jd_start - day) - 1.0)
+        values[:, QUANTITIES.index('alpha')] %= 360.0
+        return {name: values[:, i].reshape(jde.shape) for i, name in enumerate(QUANTITIES)}
+
+    def calculate_geocentric(self, spa):
+        """Fill the geocentric values used by the topocentric stage (jd must be in structure)."""
+        spa.jc = julian_century(spa.jd)
+        spa.jde = julian_ephemeris_day(spa.jd, spa.delta_t)
+        spa.jce = julian_ephemeris_century(spa.jde)
+        spa.jme = julian_ephemeris_millennium(spa.jce)
+
+        for name, value in self.evaluate(spa.jde).items():
+            setattr(spa, name, value)
+
+        spa.nu0 = greenwich_mean_sidereal_time(spa.jd, spa.jc)
+        spa.nu = greenwich_sidereal_time(spa.nu0, spa.del_psi, spa.epsilon)
+
+    def spa_calculate(self, spa):
+        """spa_calculate with the geocentric stage taken from the ephemeris; inputs may be arrays."""
+        for name in SPA_ARRAY_INPUTS:
+            value = getattr(spa, name)
+            if value is not None:
+                setattr(spa, name, np.asarray(value))
+
+        result = validate_inputs(spa)
+
+        if result == 0:
+            spa.jd = julian_day(spa.year, spa.month, spa.day, spa.hour,
+                                spa.minute, spa.second, spa.delta_ut1, spa.timezone)
+            self.calculate_geocentric(spa)
+            calculate_topocentric_sun_position(spa)
+
+        return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="拟合切比雪夫星历文件")
+    parser.add_argument('path')
+    parser.add_argument('start_year', type=int)
+    parser.add_argument('end_year', type=int)
+    parser.add_argument('--order', type=int, default=7)
+    args = parser.parse_args()
+
+    errors = build_chebyshev_ephemeris(args.path, args.start_year, args.end_year, args.order)
+    print("与完整算法相比的最大误差:")
+    for name, error in errors.items():
+        print("{0:10}\t{1:>14.3e}".format(name, error))
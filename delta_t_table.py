@@ -0,0 +1,165 @@
+"""
+    delta_t (TT - UT1) and delta_ut1 (UT1 - UTC) from a local Earth orientation table.
+
+    build_delta_t_table() reads an IERS-style table (one row per date with the MJD and
+    UT1-UTC, e.g. the IERS EOP 14 C04 series "eopc04_14_IAU2000.62-now") and writes the
+    smooth quantity delta_t = 32.184 + (TAI-UTC) - (UT1-UTC) of every row to a compact binary
+    file. DeltaTTable memory-maps such a file and answers vectorized lookups for arrays of
+    UTC modified Julian days: a binary search (np.searchsorted) finds the rows around every
+    date and delta_t is interpolated linearly between them; delta_ut1 is then derived with
+    the leap second table, so it jumps correctly at every leap second. Outside the table
+    (or without one) delta_t comes from the long-term polynomials of Espenak & Meeus
+    (NASA/TP-2006-214141) and delta_ut1 is 0.
+
+        python delta_t_table.py eopc04_14_IAU2000.62-now delta_t.bin
+
+    Plug a table into SPA with SPA.set_delta_t_provider(DeltaTTable('delta_t.bin')) and leave
+    spa.delta_t / spa.delta_ut1 as None.
+
+    File layout (little endian): a HEADER_SIZE byte header (MAGIC, number of rows) followed by
+    the rows as float64 pairs (mjd, delta_t), sorted by mjd.
+"""
+
+import argparse
+import struct
+
+import numpy as np
+
+MAGIC = b'SPADLTT1'
+HEADER_FORMAT = '<8sq'
+HEADER_SIZE = 64
+ROW_DTYPE = np.dtype([('mjd', '<f8'), ('delta_t', '<f8')])
+
+TT_TAI = 32.184
+
+## TAI - UTC [s] from the UTC modified Julian day of every leap second since 1972
+LEAP_SECONDS = np.array([
+    [41317, 10], [41499, 11], [41683, 12], [42048, 13], [42413, 14], [42778, 15],
+    [43144, 16], [43509, 17], [43874, 18], [44239, 19], [44786, 20], [45151, 21],
+    [45516, 22], [46247, 23], [47161, 24], [47892, 25], [48257, 26], [48804, 27],
+    [49169, 28], [49534, 29], [50083, 30], [50630, 31], [51179, 32], [53736, 33],
+    [54832, 34], [56109, 35], [57204, 36], [57754, 37],
+], dtype=np.float64)
+
+
+def tai_minus_utc(mjd):
+    """TAI - UTC [s] for UTC modified Julian days from 1972 on (10 s before)."""
+    index = np.searchsorted(LEAP_SECONDS[:, 0], mjd, side='right') - 1
+    return LEAP_SECONDS[np.maximum(index, 0), 1]
+
+
+def mjd_to_decimal_year(mjd):
+    return 2000.0 + (np.asarray(mjd, dtype=np.float64) - 51544.5) / 365.2425
+
+
+def long_term_delta_t(mjd):
+    """delta_t [s] of the Espenak & Meeus polynomials (valid -1999 to 3000)."""
+    y = mjd_to_decimal_year(mjd)
+    u = (y - 1820.0) / 100.0
+    long_term = -20.0 + 32.0*u**2
+
+    def poly(t, coefficients):
+        return np.polynomial.polynomial.polyval(t, coefficients)
+
+    branches = [
+        (y < -500,  long_term),
+        (y < 500,   poly(y / 100.0, [10583.6, -1014.41, 33.78311, -5.952053, -0.1798452,
+                                     0.022174192, 0.0090316521])),
+        (y < 1600,  poly((y - 1000.0) / 100.0, [1574.2, -556.01, 71.23472, 0.319781, -0.8503463,
+                                                -0.005050998, 0.0083572073])),
+        (y < 1700,  poly(y - 1600.0, [120.0, -0.9808, -0.01532, 1.0/7129.0])),
+        (y < 1800,  poly(y - 1700.0, [8.83, 0.1603, -0.0059285, 0.00013336, -1.0/1174000.0])),
+        (y < 1860,  poly(y - 1800.0, [13.72, -0.332447, 0.0068612, 0.0041116, -0.00037436,
+                                      0.0000121272, -0.0000001699, 0.000000000875])),
+        (y < 1900,  poly(y - 1860.0, [7.62, 0.5737, -0.251754, 0.01680668, -0.0004473624,
+                                      1.0/233174.0])),
+        (y < 1920,  poly(y - 1900.0, [-2.79, 1.494119, -0.0598939, 0.0061966, -0.000197])),
+        (y < 1941,  poly(y - 1920.0, [21.20, 0.84493, -0.076100, 0.0020936])),
+        (y < 1961,  poly(y - 1950.0, [29.07, 0.407, -1.0/233.0, 1.0/2547.0])),
+        (y < 1986,  poly(y - 1975.0, [45.45, 1.067, -1.0/260.0, -1.0/718.0])),
+        (y < 2005,  poly(y - 2000.0, [63.86, 0.3345, -0.060374, 0.0017275, 0.000651814,
+                                      0.00002373599])),
+        (y < 2050,  poly(y - 2000.0, [62.92, 0.32217, 0.005589])),
+        (y < 2150,  long_term - 0.5628*(2150.0 - y)),
+    ]
+    return np.select([condition for condition, value in branches],
+                     [value for condition, value in branches], long_term)
+
+
+def read_eop_table(path, mjd_column=3, dut1_column=6):
+    """(mjd, UT1-UTC) columns of the numeric rows of a whitespace separated table."""
+    rows = []
+    with open(path) as file:
+        for line in file:
+            fields = line.split()
+            try:
+                rows.append((float(fields[mjd_column]), float(fields[dut1_column])))
+            except (IndexError, ValueError):
+                continue
+    return np.array(rows, dtype=np.float64).reshape(-1, 2)
+
+
+def build_delta_t_table(source, path, mjd_column=3, dut1_column=6):
+    """Convert the IERS-style table `source` to the binary file `path`; returns the row count.
+    Rows before 1972 (no leap second based UTC) are skipped."""
+    eop = read_eop_table(source, mjd_column, dut1_column)
+    eop = eop[np.unique(eop[:, 0], return_index=True)[1]]
+    eop = eop[eop[:, 0] >= LEAP_SECONDS[0, 0]]
+
+    rows = np.empty(len(eop), dtype=ROW_DTYPE)
+    rows['mjd'] = eop[:, 0]
+    rows['delta_t'] = TT_TAI + tai_minus_utc(eop[:, 0]) - eop[:, 1]
+
+    with open(path, 'wb') as file:
+        file.write(struct.pack(HEADER_FORMAT, MAGIC, len(rows)).ljust(HEADER_SIZE, b'\0'))
+        file.write(rows.tobytes())
+    return len(rows)
+
+
+class DeltaTTable():
+
+    def __init__(self, path=None):
+        if path is None:
+            self.rows = np.empty(0, dtype=ROW_DTYPE)
+            return
+
+        with open(path, 'rb') as file:
+            header = file.read(HEADER_SIZE)
+        magic, count = struct.unpack_from(HEADER_FORMAT, header)
+        if magic != MAGIC:
+            raise ValueError("%s is not a delta_t table file" % path)
+        self.rows = np.memmap(path, dtype=ROW_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,)) \
+            if count else np.empty(0, dtype=ROW_DTYPE)
+
+    def lookup(self, mjd):
+        """(delta_t, delta_ut1) [s] for UTC modified Julian days (scalar or array)."""
+        mjd = np.asarray(mjd, dtype=np.float64)
+        delta_t = long_term_delta_t(mjd)
+        delta_ut1 = np.zeros(mjd.shape)
+
+        if len(self.rows) >= 2:
+            table_mjd = self.rows['mjd']
+            inside = (mjd >= table_mjd[0]) & (mjd <= table_mjd[-1])
+
+            index = np.clip(np.searchsorted(table_mjd, mjd, side='right'), 1, len(table_mjd) - 1)
+            mjd0, mjd1 = table_mjd[index - 1], table_mjd[index]
+            value0, value1 = self.rows['delta_t'][index - 1], self.rows['delta_t'][index]
+            interpolated = value0 + (value1 - value0) * (mjd - mjd0) / (mjd1 - mjd0)
+
+            delta_t = np.where(inside, interpolated, delta_t)
+            delta_ut1 = np.where(inside, TT_TAI + tai_minus_utc(mjd) - interpolated, 0.0)
+
+        return delta_t, delta_ut1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="将 IERS 地球定向参数表转换为 delta_t 二进制表")
+    parser.add_argument('source')
+    parser.add_argument('path')
+    parser.add_argument('--mjd-column', type=int, default=3)
+    parser.add_argument('--dut1-column', type=int, default=6)
+    args = parser.parse_args()
+
+    count = build_delta_t_table(args.source, args.path, args.mjd_column, args.dut1_column)
+    table = DeltaTTable(args.path)
+    print("已写入 %d 行, MJD %.1f 至 %.1f" % (count, table.rows['mjd'][0], table.rows['mjd'][-1]))
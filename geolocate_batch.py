@@ -0,0 +1,265 @@
+"""
+    Batch IP to latitude/longitude resolver for many sites.
+
+    get_LatLng_batch() takes any number of IP addresses and returns latitude and longitude
+    arrays of the same shape. Duplicate IPs are resolved once; fresh entries of the location
+    cache of get_IP_LatLng and a local GeoIP database are used before the network. The rest
+    is fetched concurrently by a thread pool sharing one requests.Session, whose keep-alive
+    connection pool has one connection per worker, optionally limited to `rate` requests per
+    second. IPs that cannot be resolved give NaN.
+
+    spa_sites_from_ips() turns the result into the observer arrays of a spa_data structure,
+    ready for SPA.spa_calculate_sites or spa_parallel.spa_calculate_parallel.
+
+    The benchmark runs against a local mock geolocation server with a simulated latency:
+
+        python geolocate_batch.py --count 2000 --workers 32 --latency 0.02
+"""
+
+import argparse
+import ipaddress
+import json
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from SPA import *
+from get_IP_LatLng import *
+
+WORKERS = 16
+RATE = 20.0                     ## [requests/s] default limit for the public service, None for none
+
+
+class RateLimiter():
+    """Spaces calls of wait() from all threads at least 1/rate seconds apart."""
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def pooled_session(workers=WORKERS):
+    if requests is None:
+        raise ImportError("the requests package is needed for the batch resolver")
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_LatLng_batch(ips, database=None, cache_path=CACHE_PATH, ttl=CACHE_TTL, geo_url=GEO_URL,
+                     timeout=TIMEOUT, workers=WORKERS, rate=RATE, session=None):
+    """
+    (latitude, longitude) arrays [degrees] of the IP addresses ips (any shape), NaN where
+    the location cannot be found. cache_path=None disables the cache.
+    """
+    unique, inverse = np.unique(np.asarray(ips, dtype=str), return_inverse=True)
+    latlng = np.full((unique.size, 2), np.nan)
+    counts = dict.fromkeys(("缓存", "离线数据库", "网络", "失败"), 0)
+
+    now = time.time()
+    cache = read_location_cache(cache_path) if cache_path else {}
+    missing = []
+    for index, ip in enumerate(unique):
+        try:
+            ipaddress.ip_address(ip)
+        except ValueError:
+            counts["失败"] += 1                 ## malformed address, stays NaN
+            continue
+        if cache_fresh(cache.get(ip), ttl, now):
+            latlng[index] = cache[ip]['latlng']
+            counts["缓存"] += 1
+        else:
+            missing.append(index)
+
+    if database and missing:
+        geoip = GeoIPDatabase(database)
+        remaining = []
+        for index in missing:
+            location = geoip.lookup(unique[index])
+            if location is None:
+                remaining.append(index)
+            else:
+                latlng[index] = location
+                cache[unique[index]] = {'latlng': location, 'time': now}
+                counts["离线数据库"] += 1
+        missing = remaining
+
+    if missing:
+        limiter = RateLimiter(rate)
+        own_session = session is None
+        session = session or pooled_session(workers)
+
+        def fetch(ip):
+            limiter.wait()
+            try:
+                return lookup_LatLng(ip, geo_url, timeout, session)
+            except LOOKUP_ERRORS:
+                return None
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                locations = list(executor.map(fetch, unique[missing]))
+        finally:
+            if own_session:
+                session.close()
+
+        for index, location in zip(missing, locations):
+            if location is None:
+                counts["失败"] += 1
+            else:
+                latlng[index] = location
+                cache[unique[index]] = {'latlng': location, 'time': now}
+                counts["网络"] += 1
+
+    if cache_path and counts["离线数据库"] + counts["网络"]:
+        write_location_cache(cache, cache_path)
+
+    print("%d 个IP (去重后 %d 个): " % (np.size(ips), unique.size) +
+          ", ".join("%s %d" % item for item in counts.items()))
+    shape = np.shape(ips)
+    return latlng[inverse, 0].reshape(shape), latlng[inverse, 1].reshape(shape)
+
+
+def spa_sites_from_ips(spa, ips, **kwargs):
+    """
+    Copy of the observer inputs of spa with latitude/longitude of the resolved IPs (1-D
+    arrays), and the boolean mask of the IPs that were resolved. Observer fields of spa are
+    scalars or arrays with one value per IP (shape of ips); arrays are reduced to the
+    resolved IPs as well.
+    """
+    latitude, longitude = get_LatLng_batch(np.ravel(ips), **kwargs)
+    resolved = ~(np.isnan(latitude) | np.isnan(longitude))
+
+    sites = spa_data()
+    for name in ('delta_ut1', 'delta_t', 'timezone', 'function'):
+        setattr(sites, name, getattr(spa, name))
+    for name in SPA_OBSERVER_INPUTS:
+        value = getattr(spa, name)
+        if value is not None and np.ndim(value) > 0:
+            value = np.broadcast_to(np.asarray(value), np.shape(ips)).reshape(-1)[resolved]
+        setattr(sites, name, value)
+    sites.latitude, sites.longitude = latitude[resolved], longitude[resolved]
+    return sites, resolved
+
+
+#########################################################################################
+## Mock ipinfo.io style server and benchmark
+#########################################################################################
+
+def mock_location(ip):
+    """Reproducible [latitude, longitude] of ip for the mock server."""
+    code = zlib.crc32(ip.encode())
+    return [round((code % 12000) / 100.0 - 60.0, 4), round((code // 12000 % 36000) / 100.0 - 180.0, 4)]
+
+
+def start_mock_server(latency=0.0):
+    """Mock geolocation server on a free local port; returns (server, GEO_URL style URL)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'       ## keep-alive
+
+        def do_GET(self):
+            time.sleep(latency)
+            ip = self.path.strip('/').split('/')[0]
+            body = json.dumps({'ip': ip, 'loc': '%.4f,%.4f' % tuple(mock_location(ip))}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d/%%s/json' % server.server_port
+
+
+def sample_ips(count, seed=0, duplicates=0.2):
+    """count random IPv4 addresses of which about `duplicates` repeat earlier ones."""
+    rng = np.random.default_rng(seed)
+    addresses = rng.integers(0x01000000, 0xdf000000, count)
+    repeat = rng.random(count) < duplicates
+    addresses[repeat] = addresses[rng.integers(0, count, count)][repeat]
+    return np.array(['%d.%d.%d.%d' % (a >> 24, a >> 16 & 255, a >> 8 & 255, a & 255) for a in addresses])
+
+
+def benchmark_batch(count=1000, workers=WORKERS, latency=0.01, serial_limit=200):
+    """Seconds of the serial lookup (one requests.get per IP) and of the batch resolver."""
+    ips = sample_ips(count)
+    server, url = start_mock_server(latency)
+    try:
+        serial_ips = ips[:serial_limit]
+        start = time.perf_counter()
+        for ip in serial_ips:
+            lookup_LatLng(ip, url)
+        serial = (time.perf_counter() - start) / serial_ips.size * count
+
+        start = time.perf_counter()
+        latitude, longitude = get_LatLng_batch(ips, cache_path=None, geo_url=url, workers=workers, rate=None)
+        batch = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    expected = np.array([mock_location(ip) for ip in ips])
+    if not (np.array_equal(latitude, expected[:, 0]) and np.array_equal(longitude, expected[:, 1])):
+        raise ValueError("batch resolver returned wrong locations")
+    return {'ips': count, 'unique_ips': np.unique(ips).size, 'serial_seconds': serial, 'batch_seconds': batch}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="批量IP定位性能测试 (本地模拟服务器)")
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--latency', type=float, default=0.01, help="模拟服务器每次请求的延迟 [秒]")
+    parser.add_argument('--serial-limit', type=int, default=200, help="逐个请求实际测量的最大IP数")
+    args = parser.parse_args()
+
+    report = benchmark_batch(args.count, args.workers, args.latency, args.serial_limit)
+    print("逐个请求 (估计):  %8.2f 秒" % report['serial_seconds'])
+    print("批量解析:          %8.2f 秒 (%.1f 倍)" % (report['batch_seconds'],
+                                                   report['serial_seconds'] / report['batch_seconds']))
+
+    ## feed the resolved sites into the multi-site SPA
+    spa = spa_data()
+    spa.delta_ut1, spa.delta_t, spa.timezone = 0, 67, 0
+    spa.elevation, spa.pressure, spa.temperature, spa.atmos_refract = 0, 1010, 10, 0.5667
+    spa.function = SPA_FUNC.SPA_ZA
+    server, url = start_mock_server()
+    try:
+        sites, resolved = spa_sites_from_ips(spa, sample_ips(args.count), cache_path=None, geo_url=url,
+                                             workers=args.workers, rate=None)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    times = np.arange('2020-06-21', '2020-06-22', np.timedelta64(10, 'm'), dtype='datetime64[s]')
+    geo = spa_data()
+    geo.year, geo.month, geo.day, geo.hour, geo.minute, geo.second = datetime64_to_time_fields(times)
+    geo.delta_ut1, geo.delta_t, geo.timezone = 0, 67, 0
+    spa_calculate_geocentric(geo)
+
+    start = time.perf_counter()
+    result = spa_calculate_sites(geo, sites)
+    print("%d 个站点 x %d 个时刻: %.3f 秒, SPA错误代码 %d" % (
+        sites.latitude.size, times.size, time.perf_counter() - start, result))
@@ -1,21 +1,185 @@
-import requests
-import geocoder
+"""
+    Latitude and longitude of this machine, looked up from its public IP address.
 
+    get_LatLng() resolves the location in this order, so that a normal run makes no
+    network call at all:
 
-def get_IP():
-    res = requests.get('http://jsonip.com', timeout=10)
+        1. an explicit override: the latlng argument or the SPA_LATLNG environment
+           variable ("39.742476,-105.1786")
+        2. the on-disk cache (CACHE_PATH, JSON) while its entries are younger than ttl
+        3. a local GeoIP database (database argument or SPA_GEOIP_DATABASE): a CSV file
+           with network, latitude and longitude columns (GeoLite2-City-Blocks-IPv4/IPv6.csv
+           layout), or a MaxMind .mmdb file if the geoip2 package is installed
+        4. the web services IP_URL (public IP) and GEO_URL (ipinfo.io, location of an IP)
+
+    Both URLs are arguments, so the lookup can run against a local stub HTTP server. When
+    the network fails, an expired cache entry is used rather than failing the run.
+"""
+
+import bisect
+import csv
+import ipaddress
+import json
+import os
+import time
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+IP_URL = 'http://jsonip.com'
+GEO_URL = 'http://ipinfo.io/%s/json'
+TIMEOUT = 10                    ## [s]
+
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.spa_location.json')
+CACHE_TTL = 24 * 3600           ## [s]
+
+## Errors of a failed lookup (requests.RequestException is an OSError)
+LOOKUP_ERRORS = (OSError, ValueError, KeyError, ImportError)
+
+
+def get_IP(url=IP_URL, timeout=TIMEOUT):
+    if requests is None:
+        raise ImportError("the requests package is needed to look up the public IP address")
+    res = requests.get(url, timeout=timeout)
     ip = res.json()['ip']
     print("你的IP地址为:\n" + ip)
     return ip
 
 
-def get_LatLng():
-    ip = get_IP()
-    g = geocoder.ip(ip)
-    # g = geocoder.ip('me')
-    latlng = g.latlng
-    print("\n根据你的IP地址")
-    # print("你所在城市为:\n" + g.city)
+def lookup_LatLng(ip, url=GEO_URL, timeout=TIMEOUT, session=None):
+    """[latitude, longitude] of ip from an ipinfo.io style service ("loc": "lat,lng")."""
+    if requests is None:
+        raise ImportError("the requests package is needed to look up the location of an IP address")
+    res = (session or requests).get(url % ip, timeout=timeout)
+    res.raise_for_status()
+    return [float(value) for value in res.json()['loc'].split(',')]
+
+
+def parse_LatLng(text):
+    latlng = [float(value) for value in text.split(',')]
+    if len(latlng) != 2:
+        raise ValueError("expected 'latitude,longitude', got %r" % text)
+    return latlng
+
+
+class GeoIPDatabase():
+
+    def __init__(self, path):
+        self.reader = None
+        if path.endswith('.mmdb'):
+            import geoip2.database
+            self.reader = geoip2.database.Reader(path)
+            return
+
+        ## sorted (first address, last address, latitude, longitude) of every network, per IP version
+        rows = {4: [], 6: []}
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                if not row.get('latitude') or not row.get('longitude'):
+                    continue
+                network = ipaddress.ip_network(row['network'], strict=False)
+                rows[network.version].append((int(network.network_address), int(network.broadcast_address),
+                                              float(row['latitude']), float(row['longitude'])))
+        self.networks = {version: sorted(networks) for version, networks in rows.items()}
+        self.starts = {version: [network[0] for network in networks]
+                       for version, networks in self.networks.items()}
+
+    def lookup(self, ip):
+        """[latitude, longitude] of ip, None if no network of the database contains it."""
+        if self.reader is not None:
+            import geoip2.errors
+            try:
+                location = self.reader.city(ip).location
+            except geoip2.errors.AddressNotFoundError:
+                return None
+            return [location.latitude, location.longitude]
+
+        address = ipaddress.ip_address(ip)
+        index = bisect.bisect_right(self.starts[address.version], int(address)) - 1
+        if index < 0:
+            return None
+        first, last, latitude, longitude = self.networks[address.version][index]
+        return [latitude, longitude] if int(address) <= last else None
+
+
+## The cache maps every looked up IP to {"latlng": [lat, lng], "time": unix time}, and "me"
+## to {"ip": public IP of this machine, "time": unix time}
+
+def read_location_cache(path=CACHE_PATH):
+    try:
+        with open(path) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def write_location_cache(cache, path=CACHE_PATH):
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(cache, file)
+    os.replace(temporary, path)
+
+
+def cache_fresh(entry, ttl, now=None):
+    return entry is not None and (now or time.time()) - entry['time'] < ttl
+
+
+def get_LatLng(latlng=None, ip=None, database=None, cache_path=CACHE_PATH, ttl=CACHE_TTL,
+               ip_url=IP_URL, geo_url=GEO_URL, timeout=TIMEOUT):
+    """
+    [latitude, longitude] of ip (default: the public IP of this machine).
+    latlng overrides the lookup; cache_path=None disables the cache.
+    """
+    latlng = latlng or (os.environ.get('SPA_LATLNG') and parse_LatLng(os.environ['SPA_LATLNG']))
+    if latlng:
+        print("\n使用指定的坐标")
+        print("你的经度为：\t%8.4f \n你的纬度为：\t%8.4f" % (latlng[1], latlng[0]))
+        return list(latlng)
+
+    database = database or os.environ.get('SPA_GEOIP_DATABASE')
+    now = time.time()
+    cache = read_location_cache(cache_path) if cache_path else {}
+    changed = False
+
+    if ip is None:
+        me = cache.get('me')
+        if cache_fresh(me, ttl, now):
+            ip = me['ip']
+        else:
+            try:
+                ip = get_IP(ip_url, timeout)
+                cache['me'] = {'ip': ip, 'time': now}
+                changed = True
+            except LOOKUP_ERRORS:
+                if me is None:
+                    raise
+                ip = me['ip']
+                print("无法获取IP地址, 使用缓存的IP地址:\n" + ip)
+
+    entry = cache.get(ip)
+    if cache_fresh(entry, ttl, now):
+        latlng, source = entry['latlng'], "缓存"
+    else:
+        if database:
+            latlng, source = GeoIPDatabase(database).lookup(ip), "离线数据库"
+        if not latlng:
+            try:
+                latlng, source = lookup_LatLng(ip, geo_url, timeout), "网络"
+            except LOOKUP_ERRORS:
+                if entry is None:
+                    raise
+                latlng, source = entry['latlng'], "过期缓存"
+        if source != "过期缓存":
+            cache[ip] = {'latlng': latlng, 'time': now}
+            changed = True
+
+    if cache_path and changed:
+        write_location_cache(cache, cache_path)
+
+    print("\n根据你的IP地址 (%s)" % source)
     print("你的经度为：\t%8.4f \n你的纬度为：\t%8.4f" % (latlng[1], latlng[0]))
     return latlng
 
@@ -64,10 +64,10 @@ if result == 0:  # check for SPA errors
     print("{0:10}\t{1:>14.6f}{2}".format("地球日心纬度", spa.b, " 度"))
     print("{0:10}\t{1:>14.6f}{2}".format("地日距离", spa.r, " 天文单位"))
     print("{0:10}\t{1:>14.6f}{2}".format("观察者时角", float(spa.h), " 度"))
-    print("{0:10}\t{1:>14.6f}{2}".format("章动经度", spa.del_psi[0], " 度"))
-    print("{0:10}\t{1:>14.6f}{2}".format("章动倾斜角", spa.del_epsilon[0], " 度"))
+    print("{0:10}\t{1:>14.6f}{2}".format("章动经度", spa.del_psi, " 度"))
+    print("{0:10}\t{1:>14.6f}{2}".format("章动倾斜角", spa.del_epsilon, " 度"))
     print("{0:10}\t{1:>14.6f}{2}".format("黄道倾斜度", spa.epsilon, " 度"))
-    print("{0:10}\t{1:>14.6f}{2}".format("赤纬角", spa.delta_prime[0], " 度"))
+    print("{0:10}\t{1:>14.6f}{2}".format("赤纬角", spa.delta_prime, " 度"))
     print("{0:10}\t{1:>14.6f}{2}".format("天顶角", float(spa.zenith), " 度"))
     print("{0:10}\t{1:>14.6f}{2}".format("高度角", float(spa.e), " 度"))
     print("{0:10}\t{1:>14.6f}{2}".format("方位角", float(spa.azimuth), " 度"))
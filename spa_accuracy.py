@@ -0,0 +1,323 @@
+"""
+    Differential accuracy check of SPA engines against the reference spa.c.
+
+    random_inputs() draws inputs uniformly over the whole domain accepted by
+    SPA.validate_inputs (years -2000..6000, all latitudes, elevations down to -6500 km,
+    pressures 0..5000 mbar, ...). compare_engine() runs a candidate engine and spa.c on the
+    same rows and reports the max and percentile absolute error of every output field, leaving
+    out the ill-conditioned rows of ill_conditioned_rows() (counted as 'excluded');
+    check_tolerances() turns such a report into a pass/fail gate, check_seeds() runs the gate
+    for several seeds. precision_error() measures the worst-case sun direction error of the
+    reduced precision levels (SPA.SPA_PRECISION_LEVELS) against the full series over
+    1900-2100; --precision fails when a level exceeds its documented bound (max_error).
+    validation_mismatches() compares the per-element error codes of SPA.validate_inputs_array
+    with SPA.validate_inputs run row by row, on random rows with values at the limits of every
+    field (--validation).
+
+        python spa_accuracy.py --samples 100000 --engine python --tolerance zenith=1e-6
+        python spa_accuracy.py --samples 200000 --seeds 5
+        python spa_accuracy.py --precision --samples 1000000
+        python spa_accuracy.py --validation --samples 20000
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from SPA import *
+
+## Fields compared modulo 360 degrees or 24 hours
+ANGLE_FIELDS = ('l', 'theta', 'x0', 'x1', 'x2', 'x3', 'x4', 'lamda', 'nu0', 'nu', 'alpha', 'h',
+                'alpha_prime', 'h_prime', 'azimuth_astro', 'azimuth', 'srha', 'ssha')
+HOUR_FIELDS = ('suntransit', 'sunrise', 'sunset')
+PERCENTILES = (50, 99, 99.9)
+
+DEFAULT_TOLERANCE = 1e-6        ## in the unit of each field (degrees, hours, minutes, AU, days)
+
+## Ill-conditioned rows, left out of the error statistics of the fields they affect:
+## e0 near the pole of the refraction formula (1/tan(e0 + 10.3/(e0 + 5.11))), reached with
+## atmos_refract up to 6, and rise/set hour angles near 0 or 180 degrees (|cos H0| ~ 1, day or
+## night lasting only minutes), where the rise/set correction divides by sin H'
+REFRACTION_FIELDS = ('del_e', 'e', 'zenith', 'incidence')
+RISE_SET_FIELDS = ('srha', 'ssha', 'sunrise', 'sunset')
+REFRACTION_POLE = -5.11
+REFRACTION_POLE_MARGIN = 0.01   ## [degrees] of e0
+RISE_SET_MIN_SIN = 0.01         ## |sin H'| of the rise/set hour angles (0.57 degrees)
+PRECISION_YEARS = (1900, 2100)
+
+## Values on both sides of the limits of SPA.validate_inputs, mixed into valid rows by
+## validation_inputs() (hour 24 with the random minute/second gives the 24:00 errors)
+VALIDATION_BOUNDARIES = {
+    'year':          (-2001, -2000, 6000, 6001),
+    'month':         (0, 1, 12, 13),
+    'day':           (0, 1, 31, 32),
+    'hour':          (-1, 0, 24, 24, 25),
+    'minute':        (-1, 0, 59, 60),
+    'second':        (-1e-9, 0, 59.999, 60),
+    'delta_ut1':     (-1, -0.999, 0.999, 1),
+    'delta_t':       (-8000.5, -8000, 8000, 8000.5),
+    'timezone':      (-18.5, -18, 18, 18.5),
+    'longitude':     (-180.5, -180, 180, 180.5),
+    'latitude':      (-90.5, -90, 90, 90.5),
+    'elevation':     (-6500001, -6500000),
+    'pressure':      (-1, 0, 5000, 5001),
+    'temperature':   (-273, -272.9, 6000, 6001),
+    'slope':         (-361, -360, 360, 361),
+    'azm_rotation':  (-361, -360, 360, 361),
+    'atmos_refract': (-6.5, -6, 6, 6.5),
+}
+VALIDATION_RATE = 0.1           ## probability of a boundary value in each field
+
+ENGINES = {
+    'python': lambda spa: spa_calculate_array(spa),
+    'c': lambda spa: spa_calculate_array(spa, engine='c'),
+}
+
+
+def random_inputs(count, seed=0, function=SPA_FUNC.SPA_ALL):
+    rng = np.random.default_rng(seed)
+    spa = spa_data()
+    spa.year = rng.integers(-2000, 6001, count)
+    spa.month = rng.integers(1, 13, count)
+    spa.day = rng.integers(1, 32, count)
+    spa.hour = rng.integers(0, 24, count)
+    spa.minute = rng.integers(0, 60, count)
+    spa.second = rng.uniform(0, 60, count) % 60
+    spa.delta_ut1 = rng.uniform(-1, 1, count) * 0.999
+    spa.delta_t = rng.uniform(-8000, 8000, count)
+    spa.timezone = rng.uniform(-18, 18, count)
+    spa.longitude = rng.uniform(-180, 180, count)
+    spa.latitude = rng.uniform(-90, 90, count)
+    spa.elevation = np.where(rng.random(count) < 0.1, rng.uniform(-6500000, 0, count),
+                             rng.uniform(-500, 9000, count))
+    spa.pressure = rng.uniform(0, 5000, count)
+    spa.temperature = rng.uniform(-272, 6000, count)
+    spa.slope = rng.uniform(-360, 360, count)
+    spa.azm_rotation = rng.uniform(-360, 360, count)
+    spa.atmos_refract = rng.uniform(-5, 5, count)
+    spa.function = function
+
+    ## end-of-day rows (hour 24:00:00) are valid as well
+    end_of_day = rng.random(count) < 0.01
+    spa.hour[end_of_day] = 24
+    spa.minute[end_of_day] = 0
+    spa.second[end_of_day] = 0
+    return spa
+
+
+def validation_inputs(count, seed=0, function=SPA_FUNC.SPA_ALL):
+    """random_inputs() rows with each field replaced by a value of VALIDATION_BOUNDARIES at rate VALIDATION_RATE."""
+    rng = np.random.default_rng(seed)
+    spa = random_inputs(count, seed, function)
+    for name, values in VALIDATION_BOUNDARIES.items():
+        value = getattr(spa, name).astype(np.float64)
+        boundary = rng.random(count) < VALIDATION_RATE
+        value[boundary] = rng.choice(values, count)[boundary]
+        setattr(spa, name, value)
+    return spa
+
+
+def validation_mismatches(count, seed=0):
+    """
+    Rows where SPA.validate_inputs_array differs from SPA.validate_inputs run on that row
+    alone, as (function, row, array code, scalar code), for SPA_ZA and SPA_ALL.
+    """
+    mismatches = []
+    for function in (SPA_FUNC.SPA_ZA, SPA_FUNC.SPA_ALL):
+        spa = validation_inputs(count, seed, function)
+        codes = validate_inputs_array(spa)
+        row = spa_data()
+        row.function = function
+        for index in range(count):
+            for name in VALIDATION_BOUNDARIES:
+                setattr(row, name, getattr(spa, name)[index])
+            code = validate_inputs(row)
+            if codes[index] != code:
+                mismatches.append((function, index, int(codes[index]), code))
+    return mismatches
+
+
+def copy_inputs(spa):
+    copy = spa_data()
+    for name in SPA_ARRAY_INPUTS + ('function',):
+        value = getattr(spa, name)
+        setattr(copy, name, value.copy() if isinstance(value, np.ndarray) else value)
+    return copy
+
+
+def field_error(name, value, reference):
+    value = np.asarray(value, dtype=np.float64)
+    difference = np.abs(value - reference)
+    if name in ANGLE_FIELDS:
+        difference = np.minimum(difference % 360, 360 - difference % 360)
+    elif name in HOUR_FIELDS:
+        difference = np.minimum(difference % 24, 24 - difference % 24)
+
+    both_nan = np.isnan(value) & np.isnan(reference)
+    difference = np.where(both_nan, 0.0, difference)
+    return np.where(np.isnan(difference), np.inf, difference)
+
+
+def ill_conditioned_rows(candidate, reference):
+    """Boolean masks of the rows left out of the statistics, per affected field."""
+    refraction = np.abs(reference.e0 - REFRACTION_POLE) < REFRACTION_POLE_MARGIN
+    rows = {name: refraction for name in REFRACTION_FIELDS}
+
+    if reference.srha is not None and candidate.srha is not None:
+        rise_set = np.zeros(np.shape(reference.srha), dtype=bool)
+        for spa in (candidate, reference):
+            for name in ('srha', 'ssha'):
+                rise_set |= np.abs(np.sin(np.deg2rad(getattr(spa, name)))) < RISE_SET_MIN_SIN
+        rows.update({name: rise_set for name in RISE_SET_FIELDS})
+    return rows
+
+
+def compare_engine(inputs, engine='python', fields=SPA_RESULT_FIELDS):
+    """Per-field error statistics of `engine` (name in ENGINES or callable) against spa.c."""
+    import spa_c
+
+    calculate = ENGINES[engine] if isinstance(engine, str) else engine
+    candidate = copy_inputs(inputs)
+    reference = copy_inputs(inputs)
+
+    result = calculate(candidate)
+    if np.any(result != 0):
+        raise ValueError("engine returned SPA error code %s" % np.max(result))
+    spa_c.spa_calculate_array(reference)
+
+    excluded = ill_conditioned_rows(candidate, reference)
+    report = {}
+    for name in fields:
+        value, expected = getattr(candidate, name), getattr(reference, name)
+        if value is None or expected is None:
+            continue
+        error = field_error(name, np.broadcast_to(value, np.shape(expected)), expected)
+        skip = np.broadcast_to(excluded.get(name, False), error.shape)
+        error = np.where(skip, 0.0, error).reshape(-1)
+        report[name] = {'max': float(error.max()), 'excluded': int(skip.sum())}
+        for percentile in PERCENTILES:
+            report[name]['p%g' % percentile] = float(np.percentile(error, percentile))
+        report[name]['worst_row'] = int(error.argmax())
+    return report
+
+
+def sun_direction(spa):
+    zenith  = np.deg2rad(90.0 - spa.e0)
+    azimuth = np.deg2rad(spa.azimuth)
+    return np.stack([np.sin(zenith)*np.sin(azimuth), np.sin(zenith)*np.cos(azimuth), np.cos(zenith)])
+
+
+def precision_error(level, samples=100000, seed=0, years=PRECISION_YEARS):
+    """Angle [degrees] between the topocentric sun directions of `level` and of the full series."""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('%d-01-01' % years[0], 's')
+    span = (np.datetime64('%d-01-01' % (years[1] + 1), 's') - start).astype(np.int64)
+    times = start + rng.integers(0, span, samples)
+
+    spa = spa_data()
+    spa.delta_ut1, spa.delta_t, spa.timezone = 0, 67, 0
+    spa.longitude = rng.uniform(-180, 180, samples)
+    spa.latitude = rng.uniform(-90, 90, samples)
+    spa.elevation = rng.uniform(0, 5000, samples)
+    spa.pressure, spa.temperature, spa.atmos_refract = 1010, 10, 0.5667
+    spa.function = SPA_FUNC.SPA_ZA
+
+    directions, seconds = {}, {}
+    previous = set_spa_precision('full')
+    try:
+        for name in ('full', level):
+            set_spa_precision(name)
+            start_time = time.perf_counter()
+            spa_calculate_array(spa, times)
+            seconds[name] = time.perf_counter() - start_time
+            directions[name] = sun_direction(spa)
+    finally:
+        set_spa_precision(previous)
+
+    cosine = np.clip(np.sum(directions['full'] * directions[level], axis=0), -1.0, 1.0)
+    error = np.rad2deg(np.arccos(cosine))
+    return {'max': float(error.max()), 'p99': float(np.percentile(error, 99)),
+            'seconds': seconds[level], 'full_seconds': seconds['full']}
+
+
+def check_tolerances(report, tolerances=None, default=DEFAULT_TOLERANCE):
+    """Fields whose max error exceeds the tolerance, as {name: (max error, tolerance)}."""
+    tolerances = tolerances or {}
+    failures = {}
+    for name, errors in report.items():
+        limit = tolerances.get(name, default)
+        if not errors['max'] <= limit:
+            failures[name] = (errors['max'], limit)
+    return failures
+
+
+def check_seeds(samples, seeds, engine='python', tolerances=None, default=DEFAULT_TOLERANCE):
+    """check_tolerances() for every seed; returns {seed: failures} of the failing seeds."""
+    failing = {}
+    for seed in seeds:
+        failures = check_tolerances(compare_engine(random_inputs(samples, seed), engine),
+                                    tolerances, default)
+        if failures:
+            failing[seed] = failures
+    return failing
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="与 spa.c 对比的精度检验")
+    parser.add_argument('--samples', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seeds', type=int, default=1, help="检验 seed, seed+1, ... 共 SEEDS 个随机样本")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='python')
+    parser.add_argument('--default-tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--tolerance', action='append', default=[], metavar='FIELD=VALUE')
+    parser.add_argument('--validation', action='store_true',
+                        help="逐行比较 validate_inputs_array 与 validate_inputs (随机及边界输入)")
+    parser.add_argument('--precision', action='store_true',
+                        help="检验各精度等级相对完整级数的最大太阳方向误差 (1900-2100)")
+    args = parser.parse_args()
+
+    if args.validation:
+        mismatches = validation_mismatches(args.samples, args.seed)
+        print("输入检查: 2 x %d 行, %d 行与 validate_inputs 不一致" % (args.samples, len(mismatches)))
+        for function, index, code, expected in mismatches[:20]:
+            print("    function %d 第 %d 行: 错误代码 %d, validate_inputs %d" % (function, index, code, expected))
+        sys.exit(1 if mismatches else 0)
+
+    if args.precision:
+        print("{0:10}{1:>14}{2:>14}{3:>10}".format("等级", "最大误差 (度)", "p99 (度)", "耗时比"))
+        failures = {}
+        for level, precision in SPA_PRECISION_LEVELS.items():
+            if level != 'full':
+                errors = precision_error(level, args.samples, args.seed)
+                print("{0:10}{1:>14.6f}{2:>14.6f}{3:>10.2f}".format(
+                    level, errors['max'], errors['p99'], errors['seconds'] / errors['full_seconds']))
+                if not errors['max'] <= precision.max_error:
+                    failures[level] = (errors['max'], precision.max_error)
+        for level, (error, limit) in failures.items():
+            print("超出容差: %s 最大误差 %.3e > %.3e" % (level, error, limit))
+        sys.exit(1 if failures else 0)
+
+    tolerances = {name: float(value) for name, value in (item.split('=') for item in args.tolerance)}
+
+    if args.seeds > 1:
+        seeds = range(args.seed, args.seed + args.seeds)
+        failing = check_seeds(args.samples, seeds, args.engine, tolerances, args.default_tolerance)
+        for seed in seeds:
+            print("seed %d: %s" % (seed, "超出容差" if seed in failing else "通过"))
+            for name, (error, limit) in failing.get(seed, {}).items():
+                print("    %s 最大误差 %.3e > %.3e" % (name, error, limit))
+        sys.exit(1 if failing else 0)
+
+    report = compare_engine(random_inputs(args.samples, args.seed), args.engine)
+
+    print("{0:14}{1:>12}{2:>12}{3:>12}{4:>12}{5:>10}".format("字段", "最大", "p50", "p99", "p99.9", "排除行"))
+    for name, errors in report.items():
+        print("{0:14}{1:>12.3e}{2:>12.3e}{3:>12.3e}{4:>12.3e}{5:>10d}".format(
+            name, errors['max'], errors['p50'], errors['p99'], errors['p99.9'], errors['excluded']))
+
+    failures = check_tolerances(report, tolerances, args.default_tolerance)
+    for name, (error, limit) in failures.items():
+        print("超出容差: %s 最大误差 %.3e > %.3e" % (name, error, limit))
+    sys.exit(1 if failures else 0)
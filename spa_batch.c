@@ -0,0 +1,23 @@
+/////////////////////////////////////////////
+//   Batch entry points for spa_c.py       //
+//                                         //
+//   Built into one shared library with    //
+//   the unmodified SPA.C; loops over an   //
+//   array of spa_data structures in C.    //
+/////////////////////////////////////////////
+
+#include <stddef.h>
+#include "spa.h"
+
+size_t spa_data_size(void)
+{
+    return sizeof(spa_data);
+}
+
+void spa_calculate_batch(spa_data *spa, int *result, long count)
+{
+    long i;
+
+    for (i = 0; i < count; i++)
+        result[i] = spa_calculate(&spa[i]);
+}
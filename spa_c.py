@@ -0,0 +1,103 @@
+"""
+    Binding to the bundled NREL reference implementation (spa.c) through ctypes.
+
+    The shared library is compiled from spa.c and spa_batch.c with the system C compiler
+    (the CC environment variable, else cc) the first time it is needed and rebuilt whenever
+    the sources are newer. Calls go through ctypes.CDLL, which releases the GIL, so
+    spa_calculate_array can run in several threads at once.
+
+    Usually reached through SPA.spa_calculate(spa, engine="c") and
+    SPA.spa_calculate_array(spa, engine="c").
+"""
+
+import ctypes
+import os
+import subprocess
+import sysconfig
+import threading
+
+import numpy as np
+
+from SPA import spa_data, spa_output_fields, SPA_ARRAY_INPUTS
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCES = ('spa.c', 'spa_batch.c')
+LIBRARY_PATH = os.path.join(SOURCE_DIR, 'libspa' + (sysconfig.get_config_var('SHLIB_SUFFIX') or '.so'))
+
+## Layout of the C spa_data structure; the field order of SPA.spa_data matches spa.h
+C_INT_FIELDS = ('year', 'month', 'day', 'hour', 'minute', 'function')
+SPA_C_DTYPE = np.dtype([(name, np.int32 if name in C_INT_FIELDS else np.float64)
+                        for name in spa_data.__slots__], align=True)
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def build_library(path=LIBRARY_PATH):
+    compiler = os.environ.get('CC', 'cc')
+    sources = [os.path.join(SOURCE_DIR, name) for name in SOURCES]
+    subprocess.run([compiler, '-O2', '-shared', '-fPIC', '-o', path] + sources + ['-lm'],
+                   check=True, capture_output=True)
+    return path
+
+
+def load_library():
+    global _library
+    with _library_lock:
+        if _library is None:
+            newest_source = max(os.path.getmtime(os.path.join(SOURCE_DIR, name)) for name in SOURCES)
+            if not os.path.exists(LIBRARY_PATH) or os.path.getmtime(LIBRARY_PATH) < newest_source:
+                build_library()
+
+            library = ctypes.CDLL(LIBRARY_PATH)
+            library.spa_calculate.argtypes = [ctypes.c_void_p]
+            library.spa_calculate.restype = ctypes.c_int
+            library.spa_calculate_batch.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_long]
+            library.spa_calculate_batch.restype = None
+            library.spa_data_size.restype = ctypes.c_size_t
+
+            if library.spa_data_size() != SPA_C_DTYPE.itemsize:
+                raise RuntimeError("spa_data layout of %s does not match SPA_C_DTYPE" % LIBRARY_PATH)
+            _library = library
+    return _library
+
+
+def pack_inputs(spa, shape):
+    records = np.zeros(shape, dtype=SPA_C_DTYPE)
+    for name in SPA_ARRAY_INPUTS:
+        value = getattr(spa, name)
+        if value is not None:
+            records[name] = value
+    records['function'] = spa.function.value
+    return records
+
+
+def spa_calculate(spa):
+    records = pack_inputs(spa, 1)
+    result = load_library().spa_calculate(records.ctypes.data)
+
+    if result == 0:
+        for name in spa_output_fields(spa.function):
+            setattr(spa, name, records[name][0].item())
+
+    return result
+
+
+## Loops over the broadcast input arrays in C; returns the per-element error codes
+
+def spa_calculate_array(spa):
+    inputs = [getattr(spa, name) for name in SPA_ARRAY_INPUTS if getattr(spa, name) is not None]
+    shape = np.broadcast_shapes(*[np.shape(value) for value in inputs])
+
+    records = pack_inputs(spa, shape).reshape(-1)
+    result = np.zeros(records.size, dtype=np.intc)
+    load_library().spa_calculate_batch(records.ctypes.data, result.ctypes.data, records.size)
+
+    for name in spa_output_fields(spa.function):
+        setattr(spa, name, records[name].reshape(shape))
+
+    return result.reshape(shape)
+
+
+if __name__ == '__main__':
+    print("已编译: %s" % build_library())
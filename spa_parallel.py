@@ -0,0 +1,146 @@
+"""
+    Parallel SPA for sites x times workloads.
+
+    spa_calculate_parallel() splits the (site, time) grid into blocks of site_chunk sites by
+    time_chunk times and hands them to a ProcessPoolExecutor. Every worker computes the
+    geocentric stage of its time block once, applies it to its sites (SPA.spa_calculate_sites)
+    and writes the requested fields straight into multiprocessing.shared_memory arrays, so
+    no results are pickled back; fields of the fused topocentric kernel are computed in place
+    in the shared arrays. The blocks depend only on the chunk sizes, never on the number of
+    workers, so the output is identical for any worker count.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from SPA import *
+
+_worker = {}
+
+
+def _init_worker(names, shape, inputs, times, function):
+    _worker['memories'] = [shared_memory.SharedMemory(name=name) for name in names]
+    _worker['outputs'] = [np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+                          for memory in _worker['memories']]
+    _worker['inputs'] = inputs
+    _worker['times'] = times
+    _worker['function'] = function
+    _worker['work'] = {}
+
+
+def _calculate_block(fields, site_slice, time_slice):
+    inputs = _worker['inputs']
+
+    geo = spa_data()
+    geo.year, geo.month, geo.day, geo.hour, geo.minute, geo.second = \
+        datetime64_to_time_fields(_worker['times'][time_slice])
+    for name in ('delta_ut1', 'delta_t', 'timezone'):
+        setattr(geo, name, inputs[name][time_slice])
+
+    result = spa_calculate_geocentric(geo)
+    if result != 0:
+        raise ValueError("SPA error code %d for times %s" % (result, time_slice))
+
+    sites = spa_data()
+    for name in SPA_OBSERVER_INPUTS:
+        if inputs[name] is not None:
+            setattr(sites, name, inputs[name][site_slice])
+    sites.function = _worker['function']
+
+    ## fields of the fused topocentric kernel are written straight into the shared arrays
+    if set(fields) <= set(TOPOCENTRIC_FUSED_FIELDS):
+        views = [output[site_slice, time_slice] for output in _worker['outputs']]
+        out = SpaResultArray(views[0].shape, ())
+        out.columns.update(zip(fields, views))
+    else:
+        out = None
+
+    result = spa_calculate_sites(geo, sites, out=out, work=_worker['work'])
+    if result != 0:
+        raise ValueError("SPA error code %d for sites %s" % (result, site_slice))
+
+    if out is None:
+        for name, output in zip(fields, _worker['outputs']):
+            output[site_slice, time_slice] = getattr(sites, name)
+
+
+def spa_calculate_parallel(spa, times, fields=('zenith', 'azimuth'), workers=None,
+                           site_chunk=1000, time_chunk=8760):
+    """
+    Observer fields of spa are scalars or arrays of shape (M,), delta_ut1/delta_t/timezone
+    scalars or arrays of shape (N,) like times (datetime64, local times of the timezone);
+    delta_ut1/delta_t may be None with a delta_t provider set (SPA.set_delta_t_provider).
+    Returns a SpaResultArray of shape (M, N) with the requested fields, which must be outputs
+    of spa.function (ValueError otherwise).
+    """
+    unavailable = [name for name in fields if name not in spa_output_fields(spa.function)]
+    if unavailable:
+        raise ValueError("fields %s are not calculated for function %s" % (unavailable, spa.function))
+
+    times = np.asarray(times, dtype='datetime64[us]').reshape(-1)
+    site_count = max([np.size(getattr(spa, name)) for name in SPA_OBSERVER_INPUTS
+                      if getattr(spa, name) is not None])
+    shape = (site_count, times.size)
+
+    inputs = {}
+    for name in SPA_OBSERVER_INPUTS:
+        value = getattr(spa, name)
+        inputs[name] = None if value is None else np.broadcast_to(np.asarray(value, dtype=np.float64), shape[:1])
+    ## delta_t/delta_ut1 left as None come from the delta_t provider, looked up here once
+    ## so that the workers need no provider of their own
+    time_inputs = {name: getattr(spa, name) for name in ('delta_ut1', 'delta_t', 'timezone')}
+    if time_inputs['delta_t'] is None or time_inputs['delta_ut1'] is None:
+        delta_t, delta_ut1 = lookup_delta_t(*datetime64_to_time_fields(times), spa.timezone)
+        for name, value in (('delta_t', delta_t), ('delta_ut1', delta_ut1)):
+            if time_inputs[name] is None:
+                time_inputs[name] = value
+    for name, value in time_inputs.items():
+        inputs[name] = np.broadcast_to(np.asarray(value, dtype=np.float64), shape[1:])
+
+    memories = [shared_memory.SharedMemory(create=True, size=max(1, 8 * site_count * times.size))
+                for name in fields]
+    try:
+        blocks = [(slice(s, s + site_chunk), slice(t, t + time_chunk))
+                  for s in range(0, site_count, site_chunk) for t in range(0, times.size, time_chunk)]
+
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=([memory.name for memory in memories], shape, inputs,
+                                           times, spa.function)) as executor:
+            for future in [executor.submit(_calculate_block, fields, *block) for block in blocks]:
+                future.result()
+
+        results = SpaResultArray(shape, ())
+        for name, memory in zip(fields, memories):
+            results.columns[name] = np.ndarray(shape, dtype=np.float64, buffer=memory.buf).copy()
+        return results
+
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+
+if __name__ == '__main__':
+    import time
+
+    spa = spa_data()
+    spa.delta_ut1 = 0
+    spa.delta_t = 67
+    spa.timezone = 0
+    spa.latitude = np.linspace(-60, 60, 2000)
+    spa.longitude = np.linspace(-180, 180, 2000)
+    spa.elevation = 100
+    spa.pressure = 1010
+    spa.temperature = 15
+    spa.atmos_refract = 0.5667
+    spa.function = SPA_FUNC.SPA_ZA
+    times = np.arange('2020-01-01', '2020-01-08', np.timedelta64(5, 'm'), dtype='datetime64[s]')
+
+    for workers in (1, max(2, os.cpu_count())):
+        start = time.perf_counter()
+        results = spa_calculate_parallel(spa, times, workers=workers, site_chunk=500, time_chunk=1000)
+        print("%2d 个进程: %.2f 秒, 天顶角校验和 %.10f" % (workers, time.perf_counter() - start,
+                                                       results.zenith.sum()))
@@ -0,0 +1,120 @@
+"""
+    Single-axis tracker angles from SPA results.
+
+    single_axis_tracker() takes a calculated structure (spa_data or SpaResultArray with zenith
+    and azimuth_astro, any shape of times) and tracker parameters (scalars or arrays of any
+    shape, broadcast together) and returns a SpaResultArray of shape sun shape + tracker shape
+    with the ideal (true-tracking) rotation, the backtracking rotation limited to max_angle,
+    the incidence angle and the resulting surface orientation in the SPA convention (slope,
+    azm_rotation), ready for SPA.surface_incidence_matrix.
+
+    The sun vector is calculated once and rotated into the frame of every tracker axis
+    (Marion & Dobos, NREL/TP-6A20-58891; Anderson & Mikofski, NREL/TP-5K00-76626, flat terrain):
+    y along the axis, tilted by axis_tilt and pointing to axis_azimuth (degrees eastward from
+    north), x horizontal and 90 degrees clockwise from y. Rotation angles are positive towards
+    the west for a south-pointing axis, zero with the modules level along the axis. Times with
+    the sun below the horizon give NaN.
+"""
+
+import numpy as np
+
+from SPA import *
+
+TRACKER_FIELDS = ('ideal_rotation', 'rotation', 'incidence', 'slope', 'azm_rotation')
+
+
+def sun_in_tracker_frame(spa, axis_tilt, axis_azimuth):
+    """x and z components of the unit sun vector in the tracker frame, shape sun + tracker."""
+    sun = sun_vector(spa.zenith, spa.azimuth_astro)
+    sun = np.expand_dims(sun, tuple(range(-1 - np.ndim(axis_tilt), -1)))
+    east, north, up = -sun[..., 1], -sun[..., 0], sun[..., 2]
+
+    tilt_rad    = np.deg2rad(axis_tilt)
+    azimuth_rad = np.deg2rad(axis_azimuth)
+    horizontal  = east*np.sin(azimuth_rad) + north*np.cos(azimuth_rad)
+
+    x = east*np.cos(azimuth_rad) - north*np.sin(azimuth_rad)
+    z = horizontal*np.sin(tilt_rad) + up*np.cos(tilt_rad)
+    return x, z
+
+
+def backtrack_rotation(ideal_rotation, gcr):
+    """Rotation that avoids row-to-row shading for the ground coverage ratio gcr."""
+    shade = np.abs(np.cos(np.deg2rad(ideal_rotation)) / gcr)
+    correction = np.rad2deg(np.arccos(np.minimum(shade, 1.0)))
+    return ideal_rotation - np.sign(ideal_rotation)*correction
+
+
+def surface_orientation(rotation, axis_tilt, axis_azimuth):
+    """slope and azm_rotation (degrees from south, eastward negative) of the rotated modules."""
+    slope = np.rad2deg(np.arccos(np.cos(np.deg2rad(rotation))*np.cos(np.deg2rad(axis_tilt))))
+
+    sin_slope = np.sin(np.deg2rad(slope))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = np.clip(np.sin(np.deg2rad(rotation)) / sin_slope, -1.0, 1.0)
+    delta = np.rad2deg(np.arcsin(ratio))
+    delta = np.where(np.abs(rotation) < 90, delta, np.sign(rotation)*180 - delta)
+    delta = np.where(sin_slope != 0, delta, 90.0)
+
+    return slope, limit_degrees180pm(axis_azimuth + delta - 180.0)
+
+
+def single_axis_tracker(spa, axis_tilt=0.0, axis_azimuth=180.0, max_angle=90.0, gcr=None,
+                        backtrack=True):
+    """
+    Tracker rotation [degrees] and incidence for all times of spa and all trackers.
+    gcr (ground coverage ratio) is needed for backtracking; without it, or with
+    backtrack=False, the trackers follow the ideal rotation up to max_angle.
+    """
+    backtrack = backtrack and gcr is not None
+    axis_tilt, axis_azimuth, max_angle, gcr = np.broadcast_arrays(
+        *[np.asarray(value, dtype=np.float64) for value in
+          (axis_tilt, axis_azimuth, max_angle, gcr if backtrack else 1.0)])
+
+    x, z = sun_in_tracker_frame(spa, axis_tilt, axis_azimuth)
+    below_horizon = np.expand_dims(np.asarray(spa.zenith) > 90, tuple(range(-axis_tilt.ndim, 0)))
+
+    ideal_rotation = np.where(below_horizon, np.nan, np.rad2deg(np.arctan2(x, z)))
+    if backtrack:
+        rotation = backtrack_rotation(ideal_rotation, gcr)
+    else:
+        rotation = ideal_rotation
+    rotation = np.clip(rotation, -max_angle, max_angle)
+
+    rotation_rad = np.deg2rad(rotation)
+    cosine = np.clip(x*np.sin(rotation_rad) + z*np.cos(rotation_rad), -1.0, 1.0)
+
+    results = SpaResultArray(rotation.shape, ())
+    results.columns['ideal_rotation'] = ideal_rotation
+    results.columns['rotation']       = rotation
+    results.columns['incidence']      = np.rad2deg(np.arccos(cosine))
+    results.columns['slope'], results.columns['azm_rotation'] = \
+        surface_orientation(rotation, axis_tilt, axis_azimuth)
+    return results
+
+
+if __name__ == '__main__':
+    import time
+
+    spa = spa_data()
+    spa.delta_ut1 = 0
+    spa.delta_t = 67
+    spa.timezone = 0
+    spa.longitude = -105.1786
+    spa.latitude = 39.742476
+    spa.elevation = 1830.14
+    spa.pressure = 820
+    spa.temperature = 11
+    spa.atmos_refract = 0.5667
+    spa.function = SPA_FUNC.SPA_ZA
+    times = np.arange('2020-06-21', '2020-06-22', np.timedelta64(1, 'm'), dtype='datetime64[s]')
+    spa_calculate_array(spa, times)
+
+    rows = 5000
+    axis_tilt = np.linspace(0, 10, rows)
+    axis_azimuth = np.linspace(170, 190, rows)
+
+    start = time.perf_counter()
+    results = single_axis_tracker(spa, axis_tilt, axis_azimuth, max_angle=60, gcr=0.4)
+    print("%d 个时刻 x %d 排跟踪器: %.3f 秒" % (times.size, rows, time.perf_counter() - start))
+    print("正午附近转角 %.3f 度, 入射角 %.3f 度" % (results.rotation[19*60, 0], results.incidence[19*60, 0]))